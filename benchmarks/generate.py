@@ -0,0 +1,95 @@
+"""Synthetic task databases for benchmarks
+
+Create a database of 10000 tasks, for example:
+
+    python3 generate.py /tmp/tasks.db 10000 --depth 6 --fanout 4
+
+The same arguments and seed always produce the same database.
+
+"""
+from argparse import ArgumentParser
+from datetime import date
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "src"))
+
+import DatabaseHelper
+from Task import ROOT_UUID
+
+# Dated tasks are due in this many days around today
+DATE_SPREAD = 60
+COLORS = ["#FFFFFF", "#F8E0E0", "#E0F8E0", "#E0E0F8"]
+
+
+
+def generate(path, count, depth=5, fanout=5, datedFraction=0.2,
+             archivedFraction=0.1, seed=0):
+    """Write a tree of count tasks to a new database at path
+
+    Tasks are added level by level, fanout subtasks per task, up to
+    depth levels. Once the tree is full, new top level tasks are added.
+
+    Args:
+        path (str): database file, replaced if it exists
+        count (int): number of tasks
+        depth (int): maximum number of levels
+        fanout (int): subtasks of each task that is not a leaf
+        datedFraction (float): fraction of tasks with a date
+        archivedFraction (float): fraction of tasks that are archived
+        seed (int): seed of the random generator
+
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    today = date.today().toordinal()
+
+    rows = []
+    # Tasks that can get subtasks, with their level
+    parents = [(ROOT_UUID, 0)]
+    index = 0
+    while len(rows) < count:
+        if index == len(parents):
+            index = 0  # Tree is full, start from the root again
+            parents = [(ROOT_UUID, 0)]
+        parentUUID, level = parents[index]
+        index += 1
+        for _ in range(min(fanout, count - len(rows))):
+            uuid = rng.getrandbits(128).to_bytes(16, "big")
+            taskDate = None
+            if rng.random() < datedFraction:
+                taskDate = today + rng.randint(-DATE_SPREAD, DATE_SPREAD)
+            rows.append((uuid, "Task {}".format(len(rows)), "",
+                         rng.choice(COLORS), taskDate,
+                         int(rng.random() < 0.3), parentUUID,
+                         int(rng.random() < archivedFraction)))
+            if level + 1 < depth:
+                parents.append((uuid, level + 1))
+
+    dbHelper = DatabaseHelper.TaskDatabaseHelper(path)
+    dbHelper.cursor.executemany(DatabaseHelper.UPSERT_HOT_TASK, rows)
+    dbHelper.connection.commit()
+    dbHelper.connection.close()
+
+
+def main():
+    parser = ArgumentParser(description="Generate a task database")
+    parser.add_argument("path", help="database to write")
+    parser.add_argument("count", type=int, help="number of tasks")
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--fanout", type=int, default=5)
+    parser.add_argument("--dated", type=float, default=0.2,
+                        help="fraction of tasks with a date")
+    parser.add_argument("--archived", type=float, default=0.1,
+                        help="fraction of archived tasks")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate(args.path, args.count, args.depth, args.fanout, args.dated,
+             args.archived, args.seed)
+
+
+if __name__ == "__main__":
+    main()
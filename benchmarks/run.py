@@ -0,0 +1,222 @@
+"""Benchmarks of the task model, storage and views
+
+Run the benchmarks on generated databases of 1k and 10k tasks, and
+compare them to an earlier run:
+
+    python3 run.py --tasks 1000 10000 --output new.json --compare old.json
+
+View benchmarks lay out widgets in a Gtk.OffscreenWindow. They need GTK
+and a display, for example from xvfb-run, and are skipped otherwise.
+Results are written as JSON, one record per benchmark and database size.
+
+"""
+from argparse import ArgumentParser
+from datetime import datetime
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "src"))
+
+import Config
+import DatabaseHelper
+from TaskManager import TaskManager
+from generate import generate
+
+# Tasks saved by the save_task benchmark
+SAVED_TASKS = 1000
+# Done toggles timed by the update_done benchmark
+DONE_TOGGLES = 1000
+
+
+
+def measure(function, repeat):
+    """Return run times of function in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def bench_get_root_task(path):
+    return lambda: DatabaseHelper.TaskDatabaseHelper(path).get_root_task()
+
+
+def bench_task_manager(path):
+    def run():
+        Config.LAZY_LOADING = False
+        TaskManager()
+    return run
+
+
+def bench_task_manager_lazy(path):
+    def run():
+        Config.LAZY_LOADING = True
+        TaskManager()
+    return run
+
+
+def bench_save_task(path):
+    dbHelper = DatabaseHelper.TaskDatabaseHelper(path)
+    tasks = list(dbHelper.get_root_task().iter_subtasks())[1:SAVED_TASKS + 1]
+
+    def run():
+        for task in tasks:
+            dbHelper.save_task(task)
+    return run
+
+
+def bench_update_done(path):
+    rootTask = DatabaseHelper.TaskDatabaseHelper(path).get_root_task()
+    # Changes of the deepest task propagate through most parents
+    leaf = max(rootTask.iter_subtasks(), key=lambda task: task.depth)
+
+    def run():
+        for i in range(DONE_TOGGLES):
+            leaf.set_done(i % 2 == 0)
+    return run
+
+
+def bench_get_all_archived_subtasks(path):
+    rootTask = DatabaseHelper.TaskDatabaseHelper(path).get_root_task()
+    return lambda: rootTask.get_all_archived_subtasks()
+
+
+def bench_agenda_widget(path):
+    from gi.repository import Gtk
+    from AgendaWidget import AgendaWidget
+    Config.LAZY_LOADING = False
+    taskManager = TaskManager()
+    return lambda: _show_offscreen(Gtk, AgendaWidget(taskManager))
+
+
+def bench_archive_widget(path):
+    from gi.repository import Gtk
+    from ArchiveWidget import ArchiveWidget
+    rootTask = DatabaseHelper.TaskDatabaseHelper(path).get_root_task()
+    return lambda: _show_offscreen(Gtk, ArchiveWidget(rootTask))
+
+
+def _show_offscreen(Gtk, widget):
+    """Lay out widget in an offscreen window and destroy it"""
+    window = Gtk.OffscreenWindow()
+    window.add(widget)
+    window.show_all()
+    while Gtk.events_pending():
+        Gtk.main_iteration()
+    window.destroy()
+
+
+MODEL_BENCHMARKS = [
+    ("get_root_task", bench_get_root_task),
+    ("task_manager", bench_task_manager),
+    ("task_manager_lazy", bench_task_manager_lazy),
+    ("save_task", bench_save_task),
+    ("update_done", bench_update_done),
+    ("get_all_archived_subtasks", bench_get_all_archived_subtasks),
+]
+VIEW_BENCHMARKS = [
+    ("agenda_widget", bench_agenda_widget),
+    ("archive_widget", bench_archive_widget),
+]
+
+
+def init_views():
+    """Return None if views can be benchmarked, the reason if not"""
+    try:
+        import gi
+        gi.require_version("Gtk", "3.0")
+        from gi.repository import Gtk
+    except (ImportError, ValueError) as err:
+        return str(err)
+    if not Gtk.init_check(sys.argv)[0]:
+        return "no display"
+    return None
+
+
+def run(args):
+    benchmarks = list(MODEL_BENCHMARKS)
+    skipped = "disabled" if args.skip_views else init_views()
+    if skipped is None:
+        benchmarks += VIEW_BENCHMARKS
+    else:
+        print("Skipping view benchmarks: {}".format(skipped))
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.tasks:
+            path = os.path.join(directory, "tasks{}.db".format(count))
+            generate(path, count, args.depth, args.fanout, args.dated,
+                     args.archived, args.seed)
+            Config.DB_PATH = path
+            for (name, bench) in benchmarks:
+                if args.only and name not in args.only:
+                    continue
+                times = measure(bench(path), args.repeat)
+                results.append({"name": name, "tasks": count,
+                                "min": min(times),
+                                "median": statistics.median(times),
+                                "times": times})
+                print("{:<28}{:>9} tasks {:>10.4f} s".format(
+                    name, count, statistics.median(times)))
+
+    return {"date": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "parameters": {"depth": args.depth, "fanout": args.fanout,
+                           "dated": args.dated, "archived": args.archived,
+                           "seed": args.seed, "repeat": args.repeat},
+            "skippedViews": skipped,
+            "results": results}
+
+
+def compare(old, new):
+    """Print how median times changed between two runs"""
+    oldResults = {(r["name"], r["tasks"]): r for r in old["results"]}
+    for result in new["results"]:
+        oldResult = oldResults.get((result["name"], result["tasks"]))
+        if oldResult:
+            ratio = result["median"] / oldResult["median"]
+            print("{:<28}{:>9} tasks {:>9.2f}x".format(
+                result["name"], result["tasks"], ratio))
+
+
+def main():
+    parser = ArgumentParser(description="Run TreeTodo benchmarks")
+    parser.add_argument("--tasks", type=int, nargs="+",
+                        default=[1000, 10000, 100000],
+                        help="database sizes, up to 1000000")
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--fanout", type=int, default=5)
+    parser.add_argument("--dated", type=float, default=0.2)
+    parser.add_argument("--archived", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs of each benchmark")
+    parser.add_argument("--only", nargs="+",
+                        help="names of benchmarks to run")
+    parser.add_argument("--skip-views", action="store_true")
+    parser.add_argument("--output", help="JSON file to write results to")
+    parser.add_argument("--compare", help="JSON file of an earlier run")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,148 +1,228 @@
-from os.path import join
-from datetime import date
+from bisect import bisect_left
+from datetime import date, datetime, time, timedelta
 
-from gi.repository import Gtk, Gdk
+from gi.repository import Gtk, Gdk, GLib
 
-from TaskTreeElement import TaskTreeElement
+from ElementPool import ElementPool
 import Config
+import Templates
+import Tracing
 
 
+# First days of timeline intervals, relative to today
+TIMELINE_INTERVALS = [0, 1, 2, 7, 14]
+
 
 class AgendaWidget(Gtk.ScrolledWindow):
 
-    def __init__(self, rootTask):
+    """List of dated tasks sorted by date
+
+    Only overdue tasks and those due in the next Config.AGENDA_DAYS days
+    are loaded at first. Later tasks are loaded a page at a time when
+    the list is scrolled to its bottom, and while the list is too short
+    to be scrolled.
+
+    """
+
+    def __init__(self, taskManager):
         Gtk.ScrolledWindow.__init__(self)
+        self.taskManager = taskManager
 
         self.listbox = Gtk.ListBox()
         self.listbox.set_selection_mode(Gtk.SelectionMode.NONE)
         self.listbox.modify_bg(0, Gdk.Color.parse(Config.DEFAULT_BG)[1])
+        self.listbox.set_header_func(self._update_header)
         self.add(self.listbox)
 
-        self.tasks = self.get_dated_tasks(rootTask)
-        self.populate()
-
-
+        # Templates of timeline labels shown as row headers
+        builder = Templates.new_builder("Agenda.glade")
+        self.timelineLabels = {0: builder.get_object("oneday"),
+                               1: builder.get_object("twodays"),
+                               2: builder.get_object("oneweek"),
+                               7: builder.get_object("twoweeks"),
+                               14: builder.get_object("more")}
+        self.emptyLabel = builder.get_object("emptyLabel")
+        self.listbox.set_placeholder(self.emptyLabel)
+        self._today = date.today().toordinal()
+        self._schedule_midnight_update()
+
+        self.elementPool = ElementPool("agenda")
+
+        # Sorted (day ordinal, uuid) keys of shown tasks, and the key and row
+        # of each shown task by uuid
+        self._keys = []
+        self._entries = {}
+
+        # Last date of loaded tasks, None once all tasks are loaded
+        self._lastDate = self._today + Config.AGENDA_DAYS - 1
+        self.populate(self.taskManager.get_dated_tasks(None, self._lastDate))
+        if not self._keys:
+            self.load_next_page()
+        self.connect("edge-reached", self._on_edge_reached)
+        # edge-reached is not emitted while the list fits in the view
+        self._fillSource = None
+        self.connect("size-allocate", self._schedule_fill)
+
+
+    @Tracing.traced("view", "AgendaWidget.on_update_task")
     def on_update_task(self, task):
         """Update task date in UI"""
-        # Get task element displaying given task
-        taskElement = None
-        found = False
-        for row in self.listbox.get_children():
-            taskElement = row.get_child()
-            if not isinstance(taskElement, TaskTreeElement):
-                continue
-            if taskElement.task == task:
-                found = True
-                break
+        entry = self._entries.get(task.uuid)
+        # Subtasks loaded or dearchived under an archived task belong to
+        # the archive
+        shown = (task.date is not None and not task.archived and
+                 self._is_loaded_date(task.date) and
+                 not task.has_archived_parent())
+        if entry is None and not shown:
+            return
+        if entry is not None and shown and entry[0] == self._get_key(task):
+            return
 
-        # Add element if not present
-        if not found and task.date is not None and not task.archived:
-            self.tasks.append(task)
-            self.tasks.sort(key=lambda t: t.date)
-            index = self.tasks.index(task)
+        row = self._remove_row(task) if entry else None
+        if shown:
+            self._insert_row(task, row or self._create_row(task))
+        else:
+            self.elementPool.release(row.get_child())
 
-            newElement = TaskTreeElement(task)
-            newElement.set_margin_top(6)
 
-            row = Gtk.ListBoxRow()
-            row.add(newElement)
-            row.modify_bg(0, Gdk.Color.parse(Config.DEFAULT_BG)[1])
+    @Tracing.traced("view", "AgendaWidget.on_task_deleted")
+    def on_task_deleted(self, task):
+        if task.uuid not in self._entries:
+            return
 
-            self.listbox.insert(row, index)
+        row = self._remove_row(task)
+        self.elementPool.release(row.get_child())
+        self._schedule_fill()
 
-        # Remove element is date is removed
-        elif taskElement.task.date is None:
-            row = Gtk.Widget.get_parent(taskElement)
-            self.listbox.remove(row)
-            self.tasks.remove(task)
 
-        self._update_timeline_labels()
+    def has_tasks(self):
+        """Return if any task is shown"""
+        return bool(self._keys)
 
 
-    def on_task_deleted(self, task):
-        if task not in self.tasks:
+    def load_next_page(self):
+        """Load tasks due in Config.AGENDA_DAYS days from the first date
+        after loaded tasks that has a task"""
+        if self._lastDate is None:
             return
+        firstDate = self.taskManager.get_next_date(self._lastDate)
+        if firstDate is None:
+            self._lastDate = None  # Everything is loaded
+            return
+        self._lastDate = firstDate + Config.AGENDA_DAYS - 1
+        self.populate(self.taskManager.get_dated_tasks(firstDate,
+                                                       self._lastDate))
+
+
+    @Tracing.traced("view", "AgendaWidget.populate")
+    def populate(self, tasks):
+        """Add elements of tasks to UI"""
+        for task in tasks:
+            if task.uuid not in self._entries:
+                self._insert_row(task, self._create_row(task))
+
+
+    def _on_edge_reached(self, scrolledWindow, position):
+        if position == Gtk.PositionType.BOTTOM:
+            self.load_next_page()
+
+
+    def _schedule_fill(self, *args):
+        # Rows are not added while the view is being allocated
+        if self._fillSource is None and self._lastDate is not None:
+            self._fillSource = GLib.idle_add(self._fill)
+
+
+    def _fill(self):
+        """Load pages until the list is higher than the view or all
+        tasks are loaded"""
+        self._fillSource = None
+        height = self.get_allocated_height()
+        while (self._lastDate is not None and height > 1 and
+               self.listbox.get_preferred_height()[1] <= height):
+            self.load_next_page()
+        return False
+
+
+    def _is_loaded_date(self, taskDate):
+        return self._lastDate is None or taskDate <= self._lastDate
+
+
+    def _get_key(self, task):
+        return (task.date, task.uuid)
+
+
+    def _create_row(self, task):
+        taskWidget = self.elementPool.acquire(task)
+        taskWidget.set_margin_top(Config.MARGIN)
+        row = Gtk.ListBoxRow()
+        row.modify_bg(0, Gdk.Color.parse(Config.DEFAULT_BG)[1])
+        row.add(taskWidget)
+        return row
+
+
+    def _insert_row(self, task, row):
+        """Insert row of task at its position"""
+        key = self._get_key(task)
+        index = bisect_left(self._keys, key)
+        self._keys.insert(index, key)
+        self._entries[task.uuid] = (key, row)
+        self.listbox.insert(row, index)
+        row.show_all()
+
+
+    def _remove_row(self, task):
+        """Remove row of task and return it"""
+        key, row = self._entries.pop(task.uuid)
+        del self._keys[bisect_left(self._keys, key)]
+        self.listbox.remove(row)
+        return row
+
+
+    def _update_header(self, row, before):
+        """Show a timeline label above the first row of each interval
+
+        The ListBox calls this for rows next to an inserted or removed
+        row only, so a date change touches at most two intervals.
 
-        for row in self.listbox.get_children():
-            taskElement = row.get_child()
-            if not isinstance(taskElement, TaskTreeElement):
-                continue
-            if taskElement.task == task:
-                row.remove(taskElement)
-                self.listbox.remove(row)
-                break
-
-        self.tasks.remove(task)
-        self._update_timeline_labels()
-
-
-    def get_dated_tasks(self, rootTask):
-        """Return a list of rootTask's subtasks which have a date stated
-        sorted by dates."""
-        tasks = [task for task in rootTask.get_all_subtasks() if task.date]
-        tasks.sort(key=lambda task: task.date)
-        return tasks
-
-
-    def populate(self):
-        """Add elements of self.tasks to UI"""
-        for task in self.tasks:
-            taskWidget = TaskTreeElement(task)
-            taskWidget.set_margin_top(Config.MARGIN)
-            row = Gtk.ListBoxRow()
-            row.modify_bg(0, Gdk.Color.parse(Config.DEFAULT_BG)[1])
-            row.add(taskWidget)
-            self.listbox.add(row)
-
-        self._update_timeline_labels()
-
-
-    def _update_timeline_labels(self):
-
-        # Remove all timeline labels
-        for row in self.listbox.get_children():
-            element = row.get_child()
-            if element is None:
-                self.listbox.remove(row)  # Remove empty rows
-            if isinstance(element, Gtk.Label):
-                row.remove(element)
-                self.listbox.remove(row)
-
-        intervals = [0, 1, 2, 7, 14]
-        last = -float("inf")
-        builder = Gtk.Builder()
-        builder.add_from_file(join(Config.DESIGN_DIR, "Agenda.glade"))
-        labels = {0: builder.get_object("oneday"),
-                  1: builder.get_object("twodays"),
-                  2: builder.get_object("oneweek"),
-                  7: builder.get_object("twoweeks"),
-                  14: builder.get_object("more")}
-        emptyLabel = builder.get_object("emptyLabel")
-        today = date.today()
-
-        if not len(self.listbox.get_children()):  # No scheduled tasks
-            row = Gtk.ListBoxRow()
-            row.add(emptyLabel)
-            row.modify_bg(0, Gdk.Color.parse(Config.DEFAULT_BG)[1])
-            self.listbox.add(row)
-            self.listbox.show_all()
+        """
+        interval = self._get_interval(row)
+        if interval is None or (before is not None and
+                                self._get_interval(before) == interval):
+            row.set_header(None)
             return
 
-        i = 0
-        while i < len(self.listbox.get_children()):
-            row = self.listbox.get_row_at_index(i)
-            task = row.get_child().task
-            taskDate = date(*task.date)
-            dayDiff = (taskDate - today).days
-            validIntervals = [i for i in intervals if i <= dayDiff]
-            if validIntervals:
-                candidate = max(validIntervals)
-                if candidate > last:
-                    row = Gtk.ListBoxRow()
-                    row.add(labels[candidate])
-                    row.modify_bg(0, Gdk.Color.parse(Config.DEFAULT_BG)[1])
-                    self.listbox.insert(row, i)
-                    last = candidate
-                    i += 1
-            i += 1
-        self.listbox.show_all()
+        template = self.timelineLabels[interval]
+        header = row.get_header()
+        if header is None or header.get_label() != template.get_label():
+            header = Gtk.Label(label=template.get_label())
+            header.set_attributes(template.get_attributes())
+            header.set_halign(Gtk.Align.START)
+            header.set_xalign(template.get_xalign())
+            header.set_padding(*template.get_padding())
+            header.show()
+            row.set_header(header)
+
+
+    def _get_interval(self, row):
+        """Return the first day of the timeline interval of row"""
+        dayDiff = row.get_child().task.date - self._today
+        validIntervals = [i for i in TIMELINE_INTERVALS if i <= dayDiff]
+        if validIntervals:
+            return max(validIntervals)
+        return None  # Overdue
+
+
+    def _schedule_midnight_update(self):
+        now = datetime.now()
+        midnight = datetime.combine(now.date() + timedelta(days=1), time())
+        seconds = int((midnight - now).total_seconds()) + 1
+        GLib.timeout_add_seconds(seconds, self._on_midnight)
+
+
+    def _on_midnight(self):
+        # Intervals are relative to today
+        self._today = date.today().toordinal()
+        self.listbox.invalidate_headers()
+        self._schedule_midnight_update()
+        return False
@@ -1,9 +1,9 @@
-from os.path import join
-
 from gi.repository import Gtk
 
-import Config
-from TaskTreeElement import TaskTreeElement
+import Templates
+from ElementPool import ElementPool
+from Task import TaskUpdateType
+import Tracing
 
 
 class ArchiveWidget (Gtk.ScrolledWindow):
@@ -12,12 +12,14 @@ class ArchiveWidget (Gtk.ScrolledWindow):
         Gtk.ScrolledWindow.__init__(self)
 
         self.rootTask = rootTask
+        self.elementPool = ElementPool("archive")
+        # FlowBox children showing top level archived tasks, by task
+        self._entries = {}
         self._init_ui()
 
 
     def _init_ui(self):
-        builder = Gtk.Builder()
-        builder.add_from_file(join(Config.DESIGN_DIR, "Archive.glade"))
+        builder = Templates.new_builder("Archive.glade")
         self.noTaskLabel = builder.get_object("noTaskLabel")
 
         self.archiveHolder = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
@@ -26,46 +28,66 @@ class ArchiveWidget (Gtk.ScrolledWindow):
         self.archiveHolder.pack_start(self.flowbox, False, False, 0)
         self.add(self.archiveHolder)
 
-        allTasks = self.rootTask.get_all_archived_subtasks(onlyTop=True)
-        for child in allTasks:
-            self._add_task(child)
-        if not allTasks:
-            self.flowbox.add(self.noTaskLabel)
+        self._update_entries()
 
         self.show_all()
 
 
-    def on_task_archived(self, task):
-        if task.parent.archived:
-            pass
-        elif task.get_all_archived_subtasks():
-        # TODO revisit, not everything needs to be updated
-            for child in self.flowbox.get_children():
-                self.flowbox.remove(child)
-            for task in self.rootTask.get_all_archived_subtasks(onlyTop=True):
+    def on_tasks_changed(self, changes):
+        """Update entries once for a list of (task, updateType) changes"""
+        for (task, updateType) in changes:
+            if self._changes_entries(task, updateType):
+                self._update_entries()
+                return
+
+
+    def _changes_entries(self, task, updateType):
+        if updateType == TaskUpdateType.ARCHIVED:
+            return not task.parent.archived
+        elif updateType == TaskUpdateType.DEARCHIVED:
+            return True
+        elif updateType == TaskUpdateType.DELETED:
+            return task in self._entries
+        elif updateType == TaskUpdateType.SUBTASKS_LOADED:
+            return bool(task.archivedSubtasks) and not task.archived
+        return False
+
+
+    def on_cold_storage_loaded(self):
+        self._update_entries()
+
+
+    @Tracing.traced("view", "ArchiveWidget.update_entries")
+    def _update_entries(self):
+        """Add and remove entries so that top level archived tasks are
+        shown, leaving other entries untouched"""
+        topTasks = self.rootTask.get_all_archived_subtasks(onlyTop=True)
+        topTaskSet = set(topTasks)
+        for task in [t for t in self._entries if t not in topTaskSet]:
+            self._remove_task(task)
+        for task in topTasks:
+            if task not in self._entries:
                 self._add_task(task)
-        else:
-            self._add_task(task)
-
-
-    # TODO revisit, not everythin needs to be updated
-    def on_task_dearchived(self, task):
-        for child in self.flowbox.get_children():
-            self.flowbox.remove(child)
-        for task in self.rootTask.get_all_archived_subtasks(onlyTop=True):
-            self._add_task(task)
 
-        if not self.flowbox.get_children():
+        labelHolder = self.noTaskLabel.get_parent()
+        if self._entries and labelHolder:
+            labelHolder.remove(self.noTaskLabel)
+            self.flowbox.remove(labelHolder)
+        elif not self._entries and not labelHolder:
             self.flowbox.add(self.noTaskLabel)
+        self.flowbox.show_all()
 
 
     def _add_task(self, task):
-        labelHolder = self.noTaskLabel.get_parent()
-        if labelHolder in self.flowbox.get_children():
-            labelHolder.remove(self.noTaskLabel)
-            self.flowbox.remove(labelHolder)
-        element = TaskTreeElement(task, True)
+        element = self.elementPool.acquire(task, True)
         box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
         box.pack_start(element, True, True, 0)
         self.flowbox.add(box)
-        self.flowbox.show_all()
+        self._entries[task] = box.get_parent()
+
+
+    def _remove_task(self, task):
+        flowboxChild = self._entries.pop(task)
+        for element in flowboxChild.get_child().get_children():
+            self.elementPool.release(element)
+        self.flowbox.remove(flowboxChild)
@@ -37,4 +37,33 @@ MARGIN = int(get_config_with_warning("ui", "Margin", 6))
 DEFAULT_BG = get_config_with_warning("color", "DefaultBg", "#EDEDED")
 SHADE = get_config_with_warning("color", "Shade", "#DCDCDC")
 
+# Maximum time in milliseconds changes are kept in memory before they
+# are written to the database
+FLUSH_DELAY = int(get_config_with_warning("database", "FlushDelay", 1000))
 
+# Only load root level tasks at startup and read subtasks of a task
+# when it is first expanded. Agenda and Archive read the tasks they
+# show, and their parents, from the database.
+LAZY_LOADING = get_config_with_warning(
+    "database", "LazyLoading", "no").lower() in ["yes", "true", "1"]
+# Levels of subtasks read when a task is expanded in lazy mode
+PREFETCH_DEPTH = int(get_config_with_warning("database", "PrefetchDepth", 1))
+
+# Detached task elements kept for reuse by each of Agenda and Archive
+ELEMENT_POOL_SIZE = int(get_config_with_warning("ui", "ElementPoolSize", 64))
+
+# Days of tasks shown in agenda before scrolling loads more
+AGENDA_DAYS = int(get_config_with_warning("ui", "AgendaDays", 14))
+
+# Tasks archived more than this many days ago are moved to cold storage
+# at startup and only loaded when the archive is shown, 0 to disable
+COLD_STORAGE_DAYS = int(get_config_with_warning(
+    "database", "ColdStorageDays", 0))
+
+# File timing statistics are written to on exit, tracing is disabled if
+# empty. Overridden by the TREETODO_TRACE environment variable, see
+# Tracing.
+TRACE_PATH = get_config_with_warning("debug", "TracePath", "")
+
+# Maximum number of matches listed by the search entry
+SEARCH_RESULTS = int(get_config_with_warning("ui", "SearchResults", 100))
@@ -1,13 +1,213 @@
 from datetime import datetime
 import os
+import uuid
 
 import sqlite3 as sql
 
-from Task import Task
+from Task import Task, RootTask, ArchiveIndex, ROOT_UUID
+import Tracing
 
-# TODO find a proper solution for this
+# Date of tasks with no date before migration 6
 INVALID_DATETIME = -100000000000
 
+# Columns read into a Task, in the order of Task.new_from_tuple
+TASK_COLUMNS = ("UUID, Title, Description, Color, Date, Done, ParentUUID, "
+                "Archived")
+# Columns of rows moved between Tasks and ColdTasks
+STORED_COLUMNS = TASK_COLUMNS + ", ArchivedDate"
+
+# Statements are kept constant so sqlite3 can reuse their prepared form
+UPSERT_TASK = ("INSERT INTO {}(" + TASK_COLUMNS + ") "
+               "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+               "ON CONFLICT(UUID) DO UPDATE SET Title=excluded.Title, "
+               "Description=excluded.Description, Color=excluded.Color, "
+               "Date=excluded.Date, Done=excluded.Done, "
+               "ParentUUID=excluded.ParentUUID, Archived=excluded.Archived")
+UPSERT_HOT_TASK = UPSERT_TASK.format("Tasks")
+UPSERT_COLD_TASK = UPSERT_TASK.format("ColdTasks")
+SELECT_TASKS = "SELECT " + TASK_COLUMNS + " FROM Tasks"
+# Descendants of a task up to a number of levels (-1 for all), parents
+# before children, with the number of their own children
+SELECT_SUBTREE = (
+    "WITH RECURSIVE Subtree(UUID, Level) AS ("
+    " SELECT UUID, 1 FROM Tasks WHERE ParentUUID=?"
+    " UNION ALL"
+    " SELECT Tasks.UUID, Subtree.Level + 1 FROM Tasks"
+    " JOIN Subtree ON Tasks.ParentUUID=Subtree.UUID"
+    " WHERE ? < 0 OR Subtree.Level < ?) "
+    "SELECT Tasks.UUID, Title, Description, Color, Date, Done, ParentUUID,"
+    " Archived, Subtree.Level,"
+    " (SELECT COUNT(*) FROM Tasks AS Children"
+    "  WHERE Children.ParentUUID=Tasks.UUID),"
+    " (SELECT COUNT(*) FROM Tasks AS Children"
+    "  WHERE Children.ParentUUID=Tasks.UUID AND Children.Archived=0) "
+    "FROM Subtree JOIN Tasks ON Tasks.UUID=Subtree.UUID "
+    "ORDER BY Subtree.Level")
+# Parent, grandparent and so on of a task, the root UUID being the last
+SELECT_ANCESTORS = (
+    "WITH RECURSIVE Ancestors(UUID, Level) AS ("
+    " SELECT ParentUUID, 1 FROM Tasks WHERE UUID=?"
+    " UNION ALL"
+    " SELECT Tasks.ParentUUID, Ancestors.Level + 1 FROM Tasks"
+    " JOIN Ancestors ON Tasks.UUID=Ancestors.UUID) "
+    "SELECT UUID FROM Ancestors ORDER BY Level")
+SELECT_DATED = ("SELECT UUID FROM Tasks WHERE Date BETWEEN ? AND ? "
+                "AND Archived=0 ORDER BY Date, UUID")
+SELECT_NEXT_DATE = "SELECT MIN(Date) FROM Tasks WHERE Date > ? AND Archived=0"
+SELECT_ARCHIVED = "SELECT UUID FROM Tasks WHERE Archived=1"
+# Tasks in cold storage, parents before children
+SELECT_COLD_TASKS = (
+    "WITH RECURSIVE Cold(UUID, Level) AS ("
+    " SELECT UUID, 1 FROM ColdTasks"
+    " WHERE ParentUUID NOT IN (SELECT UUID FROM ColdTasks)"
+    " UNION ALL"
+    " SELECT ColdTasks.UUID, Cold.Level + 1 FROM ColdTasks"
+    " JOIN Cold ON ColdTasks.ParentUUID=Cold.UUID) "
+    "SELECT ColdTasks.UUID, Title, Description, Color, Date, Done,"
+    " ParentUUID, Archived "
+    "FROM Cold JOIN ColdTasks ON ColdTasks.UUID=Cold.UUID "
+    "ORDER BY Cold.Level")
+# UUIDs of subtrees of tasks archived before a given time
+SELECT_FREEZABLE = (
+    "WITH RECURSIVE Freezable(UUID) AS ("
+    " SELECT UUID FROM Tasks WHERE Archived=1 AND ArchivedDate < ?"
+    " UNION"
+    " SELECT Tasks.UUID FROM Tasks"
+    " JOIN Freezable ON Tasks.ParentUUID=Freezable.UUID) "
+    "SELECT UUID FROM Freezable")
+# UUIDs of a subtree in cold storage
+SELECT_COLD_SUBTREE = (
+    "WITH RECURSIVE Subtree(UUID) AS ("
+    " SELECT ?"
+    " UNION"
+    " SELECT ColdTasks.UUID FROM ColdTasks"
+    " JOIN Subtree ON ColdTasks.ParentUUID=Subtree.UUID) "
+    "SELECT UUID FROM Subtree")
+
+# A task and all its descendants, archived or in cold storage as well.
+# Each table is joined on its own so that its parent index is used, a
+# view of both tables would be built whole for every statement. Several
+# recursive selects need SQLite 3.34.
+SUBTREE_UUIDS = (
+    "WITH RECURSIVE Subtree(UUID) AS ("
+    " SELECT ?"
+    " UNION"
+    " SELECT Tasks.UUID FROM Tasks"
+    " JOIN Subtree ON Tasks.ParentUUID=Subtree.UUID"
+    " UNION"
+    " SELECT ColdTasks.UUID FROM ColdTasks"
+    " JOIN Subtree ON ColdTasks.ParentUUID=Subtree.UUID) "
+    "SELECT UUID FROM Subtree")
+DELETE_SUBTREE_FROM_TASKS = (
+    "DELETE FROM Tasks WHERE UUID IN (" + SUBTREE_UUIDS + ")")
+DELETE_SUBTREE_FROM_COLD_TASKS = (
+    "DELETE FROM ColdTasks WHERE UUID IN (" + SUBTREE_UUIDS + ")")
+# Rows whose parent is neither the root, given as ?1, nor a stored task
+IS_ORPHAN = (
+    " WHERE ParentUUID IS NULL OR ParentUUID=UUID OR (ParentUUID<>?1"
+    "  AND ParentUUID NOT IN (SELECT UUID FROM Tasks)"
+    "  AND ParentUUID NOT IN (SELECT UUID FROM ColdTasks))")
+# Orphaned tasks of both tables and all their descendants
+ORPHAN_UUIDS = (
+    "WITH RECURSIVE Orphans(UUID) AS ("
+    " SELECT UUID FROM Tasks" + IS_ORPHAN +
+    " UNION"
+    " SELECT UUID FROM ColdTasks" + IS_ORPHAN +
+    " UNION"
+    " SELECT Tasks.UUID FROM Tasks"
+    " JOIN Orphans ON Tasks.ParentUUID=Orphans.UUID"
+    " UNION"
+    " SELECT ColdTasks.UUID FROM ColdTasks"
+    " JOIN Orphans ON ColdTasks.ParentUUID=Orphans.UUID) "
+    "SELECT UUID FROM Orphans")
+DELETE_ORPHANS_FROM_TASKS = (
+    "DELETE FROM Tasks WHERE UUID IN (" + ORPHAN_UUIDS + ")")
+DELETE_ORPHANS_FROM_COLD_TASKS = (
+    "DELETE FROM ColdTasks WHERE UUID IN (" + ORPHAN_UUIDS + ")")
+
+# Tasks matching a full text query, best matches first
+SELECT_MATCHES = (
+    "SELECT Tasks.UUID, Tasks.Title FROM TasksSearch"
+    " JOIN Tasks ON Tasks.rowid=TasksSearch.rowid "
+    "WHERE TasksSearch MATCH ? ORDER BY rank LIMIT ? OFFSET ?")
+# Titles of the parent of a task, its parent and so on
+SELECT_ANCESTOR_TITLES = (
+    "WITH RECURSIVE Ancestors(UUID, Level) AS ("
+    " SELECT ParentUUID, 1 FROM Tasks WHERE UUID=?"
+    " UNION ALL"
+    " SELECT Tasks.ParentUUID, Ancestors.Level + 1 FROM Tasks"
+    " JOIN Ancestors ON Tasks.UUID=Ancestors.UUID) "
+    "SELECT Title FROM Ancestors JOIN Tasks ON Tasks.UUID=Ancestors.UUID "
+    "ORDER BY Level")
+# The search index refers to rows of Tasks by rowid, which VACUUM may
+# change, so it can be rebuilt from Tasks
+REBUILD_SEARCH_INDEX = "INSERT INTO TasksSearch(TasksSearch) VALUES('rebuild')"
+
+# Schema migrations, the database is at version N once the first N
+# entries have been applied. Its version is kept in PRAGMA user_version.
+# Only append to this list, never change entries already released.
+MIGRATIONS = [
+    # 1: UUID as unique key, dropping duplicates older versions wrote
+    ("DELETE FROM Tasks WHERE rowid NOT IN "
+     "(SELECT MAX(rowid) FROM Tasks GROUP BY UUID)",
+     "CREATE UNIQUE INDEX IF NOT EXISTS TasksUUIDIndex ON Tasks(UUID)"),
+    # 2: Loading children of a task
+    ("CREATE INDEX TasksParentIndex ON Tasks(ParentUUID)",),
+    # 3: Date range queries for the agenda
+    ("CREATE INDEX TasksDateIndex ON Tasks(Date)",),
+    # 4: Scanning the archive
+    ("CREATE INDEX TasksArchivedIndex ON Tasks(Archived)",),
+    # 5: Cold storage for tasks archived long ago
+    ("ALTER TABLE Tasks ADD COLUMN ArchivedDate INT",
+     "UPDATE Tasks SET ArchivedDate=strftime('%s', 'now') WHERE Archived=1",
+     "CREATE TRIGGER TasksArchivedDateOnInsert AFTER INSERT ON Tasks"
+     " WHEN NEW.Archived=1 AND NEW.ArchivedDate IS NULL BEGIN"
+     " UPDATE Tasks SET ArchivedDate=strftime('%s', 'now')"
+     " WHERE UUID=NEW.UUID; END",
+     "CREATE TRIGGER TasksArchivedDateOnUpdate AFTER UPDATE OF Archived"
+     " ON Tasks WHEN NEW.Archived=1 AND OLD.Archived=0 BEGIN"
+     " UPDATE Tasks SET ArchivedDate=strftime('%s', 'now')"
+     " WHERE UUID=NEW.UUID; END",
+     "CREATE TABLE ColdTasks(UUID TEXT PRIMARY KEY, Title TEXT,"
+     " Description TEXT, Color TEXT, Date INT, Done INT, ParentUUID TEXT,"
+     " Archived INT, ArchivedDate INT)",
+     "CREATE INDEX ColdTasksParentIndex ON ColdTasks(ParentUUID)"),
+    # 6: UUIDs as 16 bytes and dates as day ordinals, as in Task. Dates
+    # go through date() so that julianday is exactly at midnight.
+    tuple(
+        ("UPDATE {} SET UUID=uuid_to_bytes(UUID),"
+         " ParentUUID=uuid_to_bytes(ParentUUID),"
+         " Date=CASE WHEN Date IS NULL OR Date={} THEN NULL ELSE"
+         " CAST(julianday(date(Date, 'unixepoch', 'localtime'))"
+         " - 1721424.5 AS INT) END").format(table, INVALID_DATETIME)
+        for table in ("Tasks", "ColdTasks")),
+    # 7: Full text search of titles and descriptions
+    ("CREATE VIRTUAL TABLE TasksSearch USING fts5(Title, Description,"
+     " content='Tasks', content_rowid='rowid')",
+     "CREATE TRIGGER TasksSearchOnInsert AFTER INSERT ON Tasks BEGIN"
+     " INSERT INTO TasksSearch(rowid, Title, Description)"
+     " VALUES (NEW.rowid, NEW.Title, NEW.Description); END",
+     "CREATE TRIGGER TasksSearchOnDelete AFTER DELETE ON Tasks BEGIN"
+     " INSERT INTO TasksSearch(TasksSearch, rowid, Title, Description)"
+     " VALUES ('delete', OLD.rowid, OLD.Title, OLD.Description); END",
+     "CREATE TRIGGER TasksSearchOnUpdate AFTER UPDATE OF Title, Description"
+     " ON Tasks BEGIN"
+     " INSERT INTO TasksSearch(TasksSearch, rowid, Title, Description)"
+     " VALUES ('delete', OLD.rowid, OLD.Title, OLD.Description);"
+     " INSERT INTO TasksSearch(rowid, Title, Description)"
+     " VALUES (NEW.rowid, NEW.Title, NEW.Description); END",
+     REBUILD_SEARCH_INDEX),
+]
+
+
+def _uuid_to_bytes(value):
+    """Convert a UUID string to 16 bytes, used by migration 6"""
+    try:
+        return uuid.UUID(value).bytes
+    except (TypeError, ValueError, AttributeError):
+        return value  # Not a UUID string, kept as it is
+
+
 
 class TaskDatabaseHelper(object):
 
@@ -20,84 +220,238 @@ class TaskDatabaseHelper(object):
     ==================
     tasks
     -----
-    UUID (str)
+    UUID (16 bytes)
     title (str)
     description (str)
     color (str)
-    date (int as UNIX Time)
+    date (int as day ordinal / NULL for none)
     done (int)
-    parentUUID (str / 00000000-0000-0000-0000-000000000000 for none)
+    parentUUID (16 bytes / 16 zero bytes for none)
     archived (int)
 
+    archivedDate (int as UNIX Time, set when archived)
+
+    coldTasks
+    ---------
+    Same columns as tasks. Subtrees of tasks archived long ago are moved
+    here by move_to_cold_storage and only read by get_cold_tasks.
+
+    tasksSearch
+    -----------
+    FTS5 index of titles and descriptions of tasks, kept up to date by
+    triggers on tasks, see search.
+
     log (Not Implemented in 0.1)
     ---
     UUID (str)
     property (str) [name of changed column in DB]
     date (int as UNIX Time)
+
+    Schema changes are applied by the migrations in MIGRATIONS when a
+    database is opened.
     """
 
     def __init__(self, pathToDb):
         """Initialize DatabaseHelper
 
-        This method connects to database at pathToDb or creates a
-        database if this fails.
+        This method connects to database at pathToDb, migrating it to
+        the current schema, or creates a database if the file does not
+        exist.
 
-        Return:
-            if connection is made
+        Raises:
+            sqlite3.Error: if the database cannot be opened or migrated
 
         """
         # Try to connect to database
         if os.path.isfile(pathToDb):
-            try:
-                self.connection = sql.connect(pathToDb)
-                self.cursor = self.connection.cursor()
-            except sql.Error:
-                return False
+            self._connect(pathToDb)
+            self._migrate()
         # Create the database if file does not exist
         else:
             self._create_database(pathToDb)
 
 
-    def get_root_task(self):
-        #TODO review
+    def get_root_task(self, loader=None):
         """Return a tree of tasks
 
         Read all tasks from a database creating the hierarchy and add
-        tasks with no parents to a rootTask.
+        tasks with no parents to a rootTask. Tasks are indexed by UUID
+        while rows are streamed from the cursor, so the hierarchy is
+        built in a single sweep.
+
+        Args:
+            loader (callable): If present, only root level tasks are
+            read and loader is set as the Task.loader of the tree to
+            read the rest on demand, see load_subtasks.
 
         """
         # Create root task
-        rootTask = Task("Roottask")
-        rootTask.uuid = "00000000-0000-0000-0000-000000000000"
-        # Get all tasks
-        self.cursor.execute("SELECT * FROM Tasks;")
-        # Create hierarchy
-        tasks = [(rootTask.uuid, rootTask)]
-        for t in self.cursor.fetchall():
-            # Add parent UUID to tuple as it is not stored in task
-            tasks.append((t[6], Task(t)))
-
-        for (parentUUID, t) in tasks:
-            if t==rootTask:
-                continue
-            parents = [p for (_, p) in tasks if parentUUID == p.uuid]
-            if parents:
-                if t.archived:
-                    parents[0].archivedSubtasks.append(t)
-                    t.parent = parents[0]
-                else:
-                    parents[0].subtasks.append(t)
-                    t.parent = parents[0]
+        rootTask = RootTask()
+        if loader:
+            rootTask.unloadedSubtaskCount = 0
+            rootTask.treeLoader = loader
+            self.load_subtasks(rootTask, 1)
+            rootTask.archiveIndex = ArchiveIndex(rootTask)
+            return rootTask
+
+        # Index all tasks by UUID, keeping their parent UUID as it is
+        # not stored in task
+        tasksByUUID = {rootTask.uuid: rootTask}
+        tasks = []
+        self.cursor.execute(SELECT_TASKS)
+        for t in self.cursor:
+            task = Task(t)
+            tasksByUUID[task.uuid] = task
+            tasks.append((t[6], task))
+
+        # Create hierarchy, tasks with unknown parents go to rootTask
+        for (parentUUID, task) in tasks:
+            parent = tasksByUUID.get(parentUUID, rootTask)
+            if parent is task:
+                parent = rootTask
+            parent.attach_subtask(task)
+
+        # Set depths, rows may come in any order so this is done
+        # once the hierarchy is complete
+        stack = [rootTask]
+        while stack:
+            task = stack.pop()
+            for child in task.subtasks + task.archivedSubtasks:
+                child.depth = task.depth + 1
+                stack.append(child)
+
+        rootTask.archiveIndex = ArchiveIndex(rootTask)
+        return rootTask
+
+
+    def load_subtasks(self, task, depth):
+        """Read subtasks of a task whose subtasks are not loaded
+
+        Args:
+            task (Task): task to load subtasks of
+            depth (int): levels of subtasks to read, None for all
+
+        Return:
+            list of tasks whose subtasks have been loaded
 
+        """
+        if depth is None:
+            depth = -1
+        tasksByUUID = {task.uuid: task}
+        loaded = [task]
+        self.cursor.execute(SELECT_SUBTREE, (task.uuid, depth, depth))
+        for t in self.cursor:
+            subtask = Task(t[:8])
+            level, subtaskCount, activeSubtaskCount = t[8:]
+            tasksByUUID[t[6]].attach_subtask(subtask)
+            if subtaskCount and level == depth:
+                subtask.unloadedSubtaskCount = activeSubtaskCount
             else:
-                if t.archived:
-                    rootTask.archivedSubtasks.append(t)
-                    t.parent = rootTask
-                else:
-                    rootTask.subtasks.append(t)
-                    t.parent = rootTask
+                loaded.append(subtask)
+            tasksByUUID[subtask.uuid] = subtask
+        task.unloadedSubtaskCount = None
+        return loaded
 
-        return rootTask
+
+    def get_ancestor_uuids(self, uuid):
+        """Return UUIDs of the parent of a task, its parent and so on"""
+        self.cursor.execute(SELECT_ANCESTORS, (uuid,))
+        return [row[0] for row in self.cursor]
+
+
+    def get_dated_task_uuids(self, firstDate, lastDate):
+        """Return UUIDs of tasks that are not archived and due between two
+        dates, sorted by date
+
+        Args:
+            firstDate (int): first day ordinal, None for all earlier tasks
+            lastDate (int): last day ordinal, included
+
+        """
+        if firstDate is None:
+            firstDate = 0
+        self.cursor.execute(SELECT_DATED, (firstDate, lastDate))
+        return [row[0] for row in self.cursor]
+
+
+    def get_next_date(self, date):
+        """Return the first date after date a task that is not archived is
+        due to, None if there is none"""
+        self.cursor.execute(SELECT_NEXT_DATE, (date,))
+        return self.cursor.fetchone()[0]
+
+
+    def get_archived_task_uuids(self):
+        """Return UUIDs of archived tasks that are not in cold storage"""
+        self.cursor.execute(SELECT_ARCHIVED)
+        return [row[0] for row in self.cursor]
+
+
+    def search(self, text, limit, offset=0):
+        """Return tasks whose title or description contain all words of
+        text, the last one possibly unfinished, best matches first
+
+        Tasks in cold storage are not searched.
+
+        Args:
+            text (str): words to search for, as typed by the user
+            limit (int): maximum number of matches
+            offset (int): number of best matches to skip
+
+        Return:
+            list of (uuid, title, ancestorTitles) of matches, ancestor
+            titles starting from the top level
+
+        """
+        # Words are quoted so that no character has a special meaning
+        words = ['"{}"'.format(word.replace('"', '""'))
+                 for word in text.split()]
+        if not words:
+            return []
+        words[-1] += "*"
+        self.cursor.execute(SELECT_MATCHES, (" ".join(words), limit, offset))
+        matches = self.cursor.fetchall()
+        results = []
+        for (uuid, title) in matches:
+            self.cursor.execute(SELECT_ANCESTOR_TITLES, (uuid,))
+            ancestorTitles = [row[0] for row in self.cursor][::-1]
+            results.append((uuid, title, ancestorTitles))
+        return results
+
+
+    def rebuild_search_index(self):
+        """Rebuild the full text search index from tasks"""
+        self.cursor.execute(REBUILD_SEARCH_INDEX)
+        self.connection.commit()
+
+
+    def get_cold_tasks(self):
+        """Return (parentUUID, task) pairs of tasks in cold storage,
+        parents before their children"""
+        self.cursor.execute(SELECT_COLD_TASKS)
+        return [(t[6], Task(t)) for t in self.cursor]
+
+
+    def move_to_cold_storage(self, days):
+        """Move subtrees of tasks archived more than days ago to cold
+        storage
+
+        Return:
+            number of tasks moved
+
+        """
+        cutoff = datetime.now().timestamp() - days * 24 * 60 * 60
+        self.cursor.execute(SELECT_FREEZABLE, (cutoff,))
+        uuids = [row[0] for row in self.cursor]
+        self._move_tasks(uuids, "Tasks", "ColdTasks")
+        return len(uuids)
+
+
+    def move_from_cold_storage(self, task):
+        """Move the subtree of task from cold storage back to tasks"""
+        self.cursor.execute(SELECT_COLD_SUBTREE, (task.uuid,))
+        uuids = [row[0] for row in self.cursor]
+        self._move_tasks(uuids, "ColdTasks", "Tasks")
 
 
     def save_task(self, task):
@@ -107,74 +461,135 @@ class TaskDatabaseHelper(object):
         given task and the task saved on disk.
 
         """
-        if self._is_task_in_database(task):
-            self._update_entry(task)
-        else:
-            self._save_new_entry(task)
+        self.apply_changes([task], [])
 
 
     def delete_task(self, task):
-        """Delete task and save change log"""
-        uuidStr = str(task.uuid)
-        self.cursor.execute("DELETE FROM Tasks"
-                            " WHERE UUID='{}'".format(uuidStr))
+        """Delete task with all its descendants and save change log"""
+        self.apply_changes([], [task])
+
+
+    def apply_changes(self, savedTasks, deletedTasks, coldUUIDs=()):
+        """Save and delete tasks in a single transaction
+
+        Args:
+            savedTasks (iterable of Task): tasks to be saved
+            deletedTasks (iterable of Task): tasks to be deleted with
+            all their descendants, whether loaded or not
+            coldUUIDs (set of bytes): UUIDs of tasks in cold storage
+
+        """
+        savedTasks = list(savedTasks)
+        deletedUUIDs = [(t.uuid,) for t in deletedTasks]
+        try:
+            self.cursor.executemany(
+                UPSERT_HOT_TASK,
+                (self._task_to_tuple(t) for t in savedTasks
+                 if t.uuid not in coldUUIDs))
+            self.cursor.executemany(
+                UPSERT_COLD_TASK,
+                (self._task_to_tuple(t) for t in savedTasks
+                 if t.uuid in coldUUIDs))
+            # Cold storage holds whole subtrees, so cold rows have no
+            # descendants in Tasks and can be deleted first
+            self.cursor.executemany(DELETE_SUBTREE_FROM_COLD_TASKS,
+                                    deletedUUIDs)
+            self.cursor.executemany(DELETE_SUBTREE_FROM_TASKS, deletedUUIDs)
+        except sql.Error:
+            self.connection.rollback()
+            raise
         self.connection.commit()
 
 
-    def _create_database(self, pathToDb):
-        # Return False if fails
+    def remove_orphans(self):
+        """Delete tasks whose parent is missing, with their descendants
+
+        Return:
+            number of tasks deleted
+
+        """
         try:
-            pathToDbDir = os.path.split(pathToDb)[0]
-            if not os.path.isdir(pathToDbDir):
-                os.mkdir(pathToDbDir)
-            self.connection = sql.connect(pathToDb)
-            self.cursor = self.connection.cursor()
-            self.cursor.execute("CREATE TABLE Tasks(UUID TEXT, Title TEXT,"
-                                "Description TEXT, Color TEXT, Date INT,"
-                                "Done INT, ParentUUID TEXT, Archived INT )")
-            self.connection.commit()
-            return True
+            self.cursor.execute(DELETE_ORPHANS_FROM_TASKS, (ROOT_UUID,))
+            removed = self.cursor.rowcount
+            # Cold rows under deleted tasks are orphans now as well
+            self.cursor.execute(DELETE_ORPHANS_FROM_COLD_TASKS, (ROOT_UUID,))
+            removed += self.cursor.rowcount
         except sql.Error:
-            return False
+            self.connection.rollback()
+            raise
+        self.connection.commit()
+        return removed
 
 
-    def _save_new_entry(self, task):
-        self.cursor.execute("INSERT INTO Tasks VALUES ('{}', '{}', '{}', '{}',"
-                            "{}, {}, '{}', {})".format(
-                                *self._task_to_tuple(task)))
+    def _create_database(self, pathToDb):
+        # Errors are raised like when opening a database, a failed
+        # migration is tried again when the file is next opened
+        pathToDbDir = os.path.split(pathToDb)[0]
+        if not os.path.isdir(pathToDbDir):
+            os.mkdir(pathToDbDir)
+        self._connect(pathToDb)
+        self.cursor.execute("CREATE TABLE Tasks(UUID TEXT PRIMARY KEY,"
+                            "Title TEXT, Description TEXT, Color TEXT,"
+                            "Date INT, Done INT, ParentUUID TEXT,"
+                            "Archived INT )")
         self.connection.commit()
+        self._migrate()
+
 
+    def _connect(self, pathToDb):
+        # Statements are timed if tracing is enabled
+        self.connection = Tracing.connect(pathToDb)
+        self.connection.create_function("uuid_to_bytes", 1, _uuid_to_bytes,
+                                        deterministic=True)
+        self.cursor = self.connection.cursor()
 
-    def _update_entry(self, task):
-        uuidStr = str(task.uuid)
-        command = ("UPDATE Tasks SET UUID='{}', Title='{}', Description='{}', "
-                   "Color='{}', Date={}, Done={}, ParentUUID='{}', "
-                   "Archived={} WHERE UUID='{}';").format(
-            *(self._task_to_tuple(task) + (uuidStr,)))
-        self.cursor.execute(command)
+
+    def _migrate(self):
+        """Bring the database schema up to date
+
+        All pending migrations are applied in a single transaction, so
+        a failed upgrade leaves the database untouched.
+
+        """
+        self.cursor.execute("PRAGMA user_version")
+        version = self.cursor.fetchone()[0]
+        if version >= len(MIGRATIONS):
+            return
+        self.cursor.execute("BEGIN")
+        try:
+            for statements in MIGRATIONS[version:]:
+                for statement in statements:
+                    self.cursor.execute(statement)
+            self.cursor.execute(
+                "PRAGMA user_version = {}".format(len(MIGRATIONS)))
+        except sql.Error:
+            self.connection.rollback()
+            raise
+        self.connection.commit()
+
+
+    def _move_tasks(self, uuids, fromTable, toTable):
+        """Move rows of tasks between tables in one transaction"""
+        rows = [(uuid,) for uuid in uuids]
+        try:
+            self.cursor.executemany(
+                "INSERT INTO {} ({}) SELECT {} FROM {} WHERE UUID=?".format(
+                    toTable, STORED_COLUMNS, STORED_COLUMNS, fromTable), rows)
+            self.cursor.executemany(
+                "DELETE FROM {} WHERE UUID=?".format(fromTable), rows)
+        except sql.Error:
+            self.connection.rollback()
+            raise
         self.connection.commit()
 
 
     def _task_to_tuple(self, task):
         """Create a tuple from task as it will be saved in the DB"""
         if task.parent:
-            parentUUID = str(task.parent.uuid)
-        else:
-            parentUUID = "00000000-0000-0000-0000-000000000000"
-        if task.date:
-            unixdate = datetime(*task.date).timestamp()
+            parentUUID = task.parent.uuid
         else:
-            unixdate = INVALID_DATETIME
+            parentUUID = ROOT_UUID
         done = int(task.done)
         archived = int(task.archived)
-        return (str(task.uuid), task.title.replace("'", "''"),
-                task.description.replace("'", "''"), task.color,
-                unixdate, done, parentUUID, archived)
-
-
-    def _is_task_in_database(self, task):
-        """Return if task is saved in DB"""
-        uuidStr = str(task.uuid)
-        self.cursor.execute("SELECT * FROM Tasks"
-                            " WHERE UUID='{}'".format(uuidStr))
-        return bool(self.cursor.fetchall())
+        return (task.uuid, task.title, task.description, task.color,
+                task.date, done, parentUUID, archived)
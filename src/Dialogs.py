@@ -1,9 +1,9 @@
-from os.path import join
-from datetime import datetime
+from datetime import date
 
 from gi.repository import Gtk, Gdk
 
 import Config
+import Templates
 from Task import Task
 
 
@@ -17,8 +17,7 @@ class DateDialog(Gtk.MessageDialog):
         self.set_title(task.title)
 
         # Add calendar
-        builder = Gtk.Builder()
-        builder.add_from_file(join(Config.DESIGN_DIR, "DateEditDialog.glade"))
+        builder = Templates.new_builder("DateEditDialog.glade")
         box = self.get_message_area()
         for child in box.get_children():
             box.remove(child)
@@ -30,15 +29,10 @@ class DateDialog(Gtk.MessageDialog):
         self.useDate.connect("toggled", self.update_calendar_sensivity)
 
         if self.task.date:
-            self.calendar.select_day(task.date[2])
-            # Gtk Calendar numbers the months from 0 to 11
-            self.calendar.select_month(task.date[1] - 1, task.date[0])
+            select_calendar_date(self.calendar, self.task.date)
             self.useDate.set_active(True)
         else:
-            now = datetime.now()
-            self.calendar.select_day(now.day)
-            # Gtk Calendar numbers the months from 0 to 11
-            self.calendar.select_month(now.month - 1, now.year)
+            select_calendar_date(self.calendar, date.today().toordinal())
 
         self.show_all()
 
@@ -59,9 +53,7 @@ class DateDialog(Gtk.MessageDialog):
             return None
 
         if result == -5:  # OK
-            date = self.calendar.get_date()
-            # GTK Calendar numbers months from 0 to 11
-            return (date[0], date[1] + 1, date[2])
+            return get_calendar_date(self.calendar)
         else:
             return self.task.date
 
@@ -79,9 +71,7 @@ class TaskEditDialog(Gtk.MessageDialog):
         for child in box.get_children():
             box.remove(child)
 
-        builder = Gtk.Builder()
-        pathToDialogXML = join(Config.DESIGN_DIR, "TitleDescEditDialog.glade")
-        builder.add_from_file(pathToDialogXML)
+        builder = Templates.new_builder("TitleDescEditDialog.glade")
 
         content = builder.get_object("newTask")
         self.titleEntry = builder.get_object("newTaskNameEntry")
@@ -128,9 +118,7 @@ class NewTaskDialog(Gtk.MessageDialog):
         box = self.get_content_area()
         box.remove(box.get_children()[0])
 
-        builder = Gtk.Builder()
-        pathToDialogXML = join(Config.DESIGN_DIR, "NewTaskWidget.glade")
-        builder.add_from_file(pathToDialogXML)
+        builder = Templates.new_builder("NewTaskWidget.glade")
 
         newTaskWidget = builder.get_object("newTaskWidget")
         box.add(newTaskWidget)
@@ -153,10 +141,7 @@ class NewTaskDialog(Gtk.MessageDialog):
             defaultColor.parse("#FFFFFF")
         self.colorButton.set_rgba(defaultColor)
 
-        now = datetime.now()
-        self.calendar.select_day(now.day)
-        # Gtk Calendar numbers the months from 0 to 11
-        self.calendar.select_month(now.month - 1, now.year)
+        select_calendar_date(self.calendar, date.today().toordinal())
 
         # Connect to signals
         signals = {"addDateToggled": self._on_add_date_toggled}
@@ -182,12 +167,11 @@ class NewTaskDialog(Gtk.MessageDialog):
             end = buffer_.get_end_iter()
             description = buffer_.get_text(start, end, True)
             if self.useCalendarCheck.get_active():
-                tdate = self.calendar.get_date()
-                date = (tdate[0], tdate[1] + 1, tdate[2])
+                date_ = get_calendar_date(self.calendar)
             else:
-                date = None
+                date_ = None
             color = self.colorButton.get_rgba()
-            return (title, description, date, color)
+            return (title, description, date_, color)
         else:
             return None
 
@@ -202,9 +186,7 @@ class TaskEditPopover(Gtk.Popover):
         self.task = taskWidget.task
         self.mainWindow = taskWidget.get_toplevel()
 
-        self.builder = Gtk.Builder()
-        self.builder.add_from_file(join(Config.DESIGN_DIR,
-                                        "TaskPopover.glade"))
+        self.builder = Templates.new_builder("TaskPopover.glade")
 
         handlers = {"onEditText": self._on_text_edit,
                     "onEditDate": self._on_date_edit,
@@ -302,15 +284,9 @@ class TaskEditPopover(Gtk.Popover):
         self.dateEdit = self.builder.get_object("editDateMenu")
         self.calendar = self.builder.get_object("calendar")
         if self.task.date:
-            self.calendar.select_day(self.task.date[2])
-            # Gtk Calendar numbers the months from 0 to 11
-            self.calendar.select_month(
-                self.task.date[1] - 1, self.task.date[0])
+            select_calendar_date(self.calendar, self.task.date)
         else:
-            now = datetime.now()
-            self.calendar.select_day(now.day)
-            # Gtk Calendar numbers the months from 0 to 11
-            self.calendar.select_month(now.month - 1, now.year)
+            select_calendar_date(self.calendar, date.today().toordinal())
         self.stack.add(self.dateEdit)
 
 
@@ -332,15 +308,14 @@ class TaskEditPopover(Gtk.Popover):
         start = buffer_.get_start_iter()
         end = buffer_.get_end_iter()
         newDescription = buffer_.get_text(start, end, True)
-        self.task.set_title(newTitle)
-        self.task.set_description(newDescription)
+        with self.task.batch():
+            self.task.set_title(newTitle)
+            self.task.set_description(newDescription)
         self.hide()
 
 
     def _on_date_edit(self, button):
-        newDate = self.calendar.get_date()
-        # Gtk Calendar numbers the months from 0 to 11
-        newDate = (newDate[0], newDate[1] + 1, newDate[2])
+        newDate = get_calendar_date(self.calendar)
         self.task.set_date(newDate)
         self.hide()
 
@@ -362,8 +337,9 @@ def edit_task_title_description(toplevel, task):
         pass
     finally:
         dialog.destroy()
-    task.set_title(newTitle)
-    task.set_description(newDescription)
+    with task.batch():
+        task.set_title(newTitle)
+        task.set_description(newDescription)
     return newTitle, newDescription
 
 
@@ -412,6 +388,21 @@ def add_subtask(toplevel, task):
     return newTask
 
 
+def select_calendar_date(calendar, dayOrdinal):
+    """Show date given as a day ordinal in a Gtk.Calendar"""
+    date_ = date.fromordinal(dayOrdinal)
+    calendar.select_day(date_.day)
+    # Gtk Calendar numbers the months from 0 to 11
+    calendar.select_month(date_.month - 1, date_.year)
+
+
+def get_calendar_date(calendar):
+    """Return date selected in a Gtk.Calendar as a day ordinal"""
+    year, month, day = calendar.get_date()
+    # Gtk Calendar numbers the months from 0 to 11
+    return date(year, month + 1, day).toordinal()
+
+
 def strFromColor(color):
     redStr = "{0:02x}".format(int(color.red * 255))
     greenStr = "{0:02x}".format(int(color.green * 255))
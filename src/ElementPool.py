@@ -0,0 +1,68 @@
+from logging import debug
+
+from gi.repository import Gtk
+
+from TaskTreeElement import TaskTreeElement
+import Config
+
+
+
+class ElementPool(object):
+
+    """A bounded pool of detached TaskTreeElements
+
+    Views that often replace the elements they show release them to the
+    pool and acquire them bound to a different task, instead of
+    destroying and creating them. Hits and misses are counted to help
+    choosing the pool size.
+
+    """
+
+    def __init__(self, name, size=Config.ELEMENT_POOL_SIZE):
+        """Create ElementPool
+
+        Args:
+            name (str): name of the pool used in logs
+            size (int): maximum number of detached elements kept
+
+        """
+        self.name = name
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._elements = []
+
+
+    def acquire(self, task, includeArchived=False):
+        """Return an element showing task, reusing a released one if any"""
+        if self._elements:
+            self.hits += 1
+            element = self._elements.pop()
+            element.bind(task, includeArchived)
+        else:
+            self.misses += 1
+            element = TaskTreeElement(task, includeArchived)
+        return element
+
+
+    def release(self, element):
+        """Detach element and keep it for reuse if the pool is not full"""
+        container = Gtk.Widget.get_parent(element)
+        if container:
+            container.remove(element)
+        element.unbind()
+        if len(self._elements) < self.size:
+            self._elements.append(element)
+        else:
+            element.destroy()
+
+
+    def get_stats(self):
+        """Return a dict of hit and miss counts and pooled elements"""
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "pooled": len(self._elements)}
+
+
+    def log_stats(self):
+        debug("Element pool {}: {}".format(self.name, self.get_stats()))
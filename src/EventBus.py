@@ -0,0 +1,124 @@
+from contextlib import contextmanager
+
+from Task import TaskUpdateType
+import Tracing
+
+# Names of update types, used in traces
+UPDATE_TYPE_NAMES = {value: name for (name, value)
+                     in vars(TaskUpdateType).items() if name.isupper()}
+
+
+
+class EventBus(object):
+
+    """Dispatcher of task updates
+
+    Subscribers register for the updates of one task, by UUID, or of
+    all tasks, optionally limited to some update types. Subscribing
+    costs the same however many tasks exist, and a callback can only be
+    registered once for a UUID.
+
+    Change subscribers receive updates as lists of (task, updateType)
+    changes instead. Updates published inside batch() are collected,
+    with duplicates dropped, and dispatched together when the batch
+    ends, so change subscribers are called once for the whole batch.
+    Updates carry no details, so subscribers read the current state of
+    the task, for example all of its subtasks after SUBTASK_ADDED.
+
+    """
+
+    def __init__(self):
+        # Subscribers by task UUID, None for all tasks. Each maps
+        # callback to update types it receives, None for all.
+        self._subscribers = {}
+        self._changeSubscribers = []
+        # Changes of the running batch by (UUID, updateType), in order
+        self._pendingChanges = {}
+        self._batchDepth = 0
+
+
+    def subscribe(self, callback, uuid=None, updateTypes=None):
+        """Call callback(task, updateType) on updates
+
+        Subscribing a callback again for the same UUID replaces its
+        update types.
+
+        Args:
+            callback (callable): function to call
+            uuid (bytes): only receive updates of this task, None for all
+            updateTypes (iterable of int): only receive updates of these
+            TaskUpdateTypes, None for all
+
+        """
+        if updateTypes is not None:
+            updateTypes = frozenset(updateTypes)
+        self._subscribers.setdefault(uuid, {})[callback] = updateTypes
+
+
+    def unsubscribe(self, callback, uuid=None):
+        """Stop calling callback on updates of task with UUID"""
+        subscribers = self._subscribers.get(uuid)
+        if subscribers:
+            subscribers.pop(callback, None)
+            if not subscribers:
+                del self._subscribers[uuid]
+
+
+    def subscribe_changes(self, callback):
+        """Call callback(changes) with lists of (task, updateType)"""
+        if callback not in self._changeSubscribers:
+            self._changeSubscribers.append(callback)
+
+
+    def unsubscribe_changes(self, callback):
+        if callback in self._changeSubscribers:
+            self._changeSubscribers.remove(callback)
+
+
+    @contextmanager
+    def batch(self):
+        """Collect updates published inside the with block and dispatch
+        them when the outermost batch ends"""
+        self._batchDepth += 1
+        try:
+            yield
+        finally:
+            self._batchDepth -= 1
+            if self._batchDepth == 0 and self._pendingChanges:
+                changes = list(self._pendingChanges.values())
+                self._pendingChanges = {}
+                self._dispatch(changes)
+
+
+    def publish(self, task, updateType):
+        """Dispatch an update of task, or keep it for the end of the
+        running batch"""
+        if self._batchDepth:
+            self._pendingChanges.setdefault((task.uuid, updateType),
+                                            (task, updateType))
+        else:
+            self._dispatch([(task, updateType)])
+
+
+    def _dispatch(self, changes):
+        for (task, updateType) in changes:
+            with Tracing.span("update", UPDATE_TYPE_NAMES.get(updateType)):
+                self._call_subscribers(task, updateType)
+        with Tracing.span("changes"):
+            for callback in list(self._changeSubscribers):
+                if callback in self._changeSubscribers:
+                    callback(changes)
+
+
+    def _call_subscribers(self, task, updateType):
+        """Call subscribers of all tasks, then those of task"""
+        for uuid in (None, task.uuid):
+            subscribers = self._subscribers.get(uuid)
+            if not subscribers:
+                continue
+            # Subscribers may change while being called
+            for callback, updateTypes in list(subscribers.items()):
+                if callback not in subscribers:
+                    continue  # Unsubscribed by an earlier callback
+                if updateTypes is None or updateType in updateTypes:
+                    callback(task, updateType)
@@ -0,0 +1,22 @@
+from gi.repository import GLib
+
+
+
+class GLibScheduler(object):
+
+    """Runs delayed work of TaskManager on the GLib main loop
+
+    TaskManager does not depend on GObject, so the application passes
+    it one of these. Without a scheduler, changes are only written when
+    TaskManager.flush is called.
+
+    """
+
+    def timeout_add(self, milliseconds, callback):
+        """Call callback after milliseconds, return an id of the call"""
+        return GLib.timeout_add(milliseconds, callback)
+
+
+    def source_remove(self, sourceId):
+        """Cancel a call scheduled by timeout_add"""
+        GLib.source_remove(sourceId)
@@ -0,0 +1,131 @@
+from gi.repository import GLib, GObject, Gtk, Pango
+
+import Config
+
+# Matches read from the database at a time
+PAGE_SIZE = 20
+# Separator of ancestor titles shown below matches
+PATH_SEPARATOR = " › "
+
+
+
+class SearchWidget(Gtk.SearchEntry):
+
+    """Search entry listing tasks that match its text in a popover
+
+    Matches are read a page at a time while the main loop is idle, so
+    the first ones are shown at once and typing is not blocked. Changing
+    the text cancels the search that is running. The "task-selected"
+    signal is emitted with the UUID of a match when it is activated.
+
+    """
+
+    __gsignals__ = {
+        'task-selected': (GObject.SIGNAL_RUN_FIRST, None, (object,))}
+
+
+    def __init__(self, taskManager):
+        Gtk.SearchEntry.__init__(self)
+        self.taskManager = taskManager
+        # Idle source reading the next page of matches
+        self._searchSource = None
+        # UUIDs of matches by their rows
+        self._uuids = {}
+
+        self.set_placeholder_text("Search tasks")
+        self.connect("search-changed", self._on_search_changed)
+        self.connect("stop-search", self._on_stop_search)
+        self._init_popover()
+
+
+    def cancel(self):
+        """Stop reading matches of the current text"""
+        if self._searchSource is not None:
+            GLib.source_remove(self._searchSource)
+            self._searchSource = None
+
+
+    def _init_popover(self):
+        self.listbox = Gtk.ListBox()
+        self.listbox.set_selection_mode(Gtk.SelectionMode.NONE)
+        self.listbox.set_placeholder(Gtk.Label(label="No tasks found"))
+        self.listbox.connect("row-activated", self._on_row_activated)
+
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+        scrolled.set_size_request(Config.DEFAULT_PANE_WIDTH,
+                                  Config.DEFAULT_PANE_WIDTH)
+        scrolled.add(self.listbox)
+
+        self.popover = Gtk.Popover(relative_to=self)
+        # Keep the focus in the entry while the user types
+        self.popover.set_modal(False)
+        self.popover.add(scrolled)
+
+
+    def _on_search_changed(self, entry):
+        self.cancel()
+        for row in self.listbox.get_children():
+            self.listbox.remove(row)
+        self._uuids.clear()
+
+        text = self.get_text()
+        if not text.strip():
+            self.popover.hide()
+            return
+        self.popover.show_all()
+        self._searchSource = GLib.idle_add(self._on_idle, self._search(text))
+
+
+    def _search(self, text):
+        """Add rows of matches of text, yielding after each page"""
+        offset = 0
+        while offset < Config.SEARCH_RESULTS:
+            matches = self.taskManager.search(text, PAGE_SIZE, offset)
+            for (uuid, title, ancestorTitles) in matches:
+                self._add_row(uuid, title, ancestorTitles)
+            if len(matches) < PAGE_SIZE:
+                return
+            offset += PAGE_SIZE
+            yield
+
+
+    def _on_idle(self, pages):
+        try:
+            next(pages)
+            return True
+        except StopIteration:
+            self._searchSource = None
+            return False
+
+
+    def _add_row(self, uuid, title, ancestorTitles):
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        box.set_border_width(Config.MARGIN)
+        titleLabel = Gtk.Label(label=title, xalign=0)
+        titleLabel.set_ellipsize(Pango.EllipsizeMode.END)
+        box.pack_start(titleLabel, False, False, 0)
+        if ancestorTitles:
+            pathLabel = Gtk.Label(xalign=0)
+            path = PATH_SEPARATOR.join(ancestorTitles)
+            pathLabel.set_markup(
+                "<small>{}</small>".format(GLib.markup_escape_text(path)))
+            pathLabel.set_ellipsize(Pango.EllipsizeMode.START)
+            pathLabel.get_style_context().add_class("dim-label")
+            box.pack_start(pathLabel, False, False, 0)
+
+        row = Gtk.ListBoxRow()
+        row.add(box)
+        row.show_all()
+        self.listbox.add(row)
+        self._uuids[row] = uuid
+
+
+    def _on_row_activated(self, listbox, row):
+        self.popover.hide()
+        self.emit("task-selected", self._uuids[row])
+
+
+    def _on_stop_search(self, entry):
+        self.cancel()
+        self.popover.hide()
@@ -1,12 +1,20 @@
 import os
 import uuid
-from datetime import datetime
+from collections import deque
+from contextlib import nullcontext
 
-from gi.repository import GObject
+import Tracing
 
 
 
-class TaskUpdateType(GObject.GObject):
+# UUID of root tasks, whose children are the top level tasks
+ROOT_UUID = bytes(16)
+# Colors read from the database, tasks of the same color share a string
+_colors = {}
+
+
+
+class TaskUpdateType(object):
     TITLE = 0
     DESCRIPTION = 1
     COLOR = 2
@@ -18,18 +26,113 @@ class TaskUpdateType(GObject.GObject):
     ARCHIVED = 8
     DEARCHIVED = 9
     SUBTASK_DEARCHIVED = 10
+    SUBTASKS_LOADED = 11
+    ACTIVATED = 12
+
+
+
+class TraversalOrder(object):
+    PRE_ORDER = 0
+    POST_ORDER = 1
+    BREADTH_FIRST = 2
+
+
+
+class ArchiveIndex(object):
+
+    """Archived tasks of a task tree
+
+    The index is kept up to date by the tasks of the tree as they are
+    archived, dearchived, loaded and deleted, so listing the archive
+    takes time linear in the number of archived tasks.
+
+    """
+
+    def __init__(self, rootTask):
+        # Dicts are used as ordered sets
+        self._all = {}
+        self._top = {}
+        self.add_subtree(rootTask)
+
+
+    def get_archived(self, onlyTop=False):
+        """Return a list of archived tasks
+
+        Args:
+            onlyTop: only get tasks whose parents are not archived
+
+        """
+        return list(self._top if onlyTop else self._all)
+
+
+    def add_subtree(self, task):
+        """Add archived tasks of a subtree that joined the tree"""
+        stack = [(task, task.has_archived_parent())]
+        while stack:
+            task, inArchive = stack.pop()
+            if task.archived:
+                self._all[task] = None
+                if not inArchive:
+                    self._top[task] = None
+            inArchive = inArchive or task.archived
+            stack.extend((child, inArchive) for child
+                         in reversed(task.subtasks))
+            stack.extend((child, inArchive) for child
+                         in reversed(task.archivedSubtasks))
+
 
+    def remove_subtree(self, task):
+        """Remove archived tasks of a subtree that left the tree"""
+        for subtask in task.iter_subtasks(includeArchived=True):
+            self._all.pop(subtask, None)
+            self._top.pop(subtask, None)
 
 
-class Task(GObject.GObject):
+    def on_archived(self, task):
+        self._all[task] = None
+        if not task.has_archived_parent():
+            # Archived subtasks are no longer on top of the archive
+            for subtask in task.iter_subtasks(includeArchived=True):
+                self._top.pop(subtask, None)
+            self._top[task] = None
 
-    __gsignals__ = {
-        'updated': (GObject.SIGNAL_RUN_FIRST, None, (int,)),
-        'activated': (GObject.SIGNAL_RUN_FIRST, None, ())}
 
+    def on_dearchived(self, task):
+        self._all.pop(task, None)
+        self._top.pop(task, None)
+        if not task.has_archived_parent():
+            # Topmost archived subtasks are now on top of the archive
+            for subtask in task._iter_top_archived(includeSelf=False):
+                self._top[subtask] = None
+
+
+
+class Task(object):
+
+    """A task in a tree of tasks
+
+    Tasks are plain Python objects, so they can be used without GTK.
+    Their updates are published to the EventBus of the tree.
+
+    To keep large trees small in memory, tasks have no __dict__, dates
+    are day ordinals as returned by datetime.date.toordinal and UUIDs
+    are 16 bytes, see uuid.UUID.bytes. They are converted to display
+    formats by the UI only. State shared by the whole tree is kept by
+    its RootTask.
+
+    """
+
+    __slots__ = ("title", "description", "color", "date", "done",
+                 "archived", "subtasks", "doneSubtaskCount",
+                 "archivedSubtasks", "parent", "depth",
+                 "unloadedSubtaskCount", "uuid")
+
+    # Tasks that are not in a tree of a RootTask have none of its state
+    treeBus = None
+    treeLoader = None
+    archiveIndex = None
 
     def __init__(self, arg):
-        GObject.GObject.__init__(self)
         if type(arg) == tuple:
             self.new_from_tuple(arg)
         elif type(arg) == str:
@@ -46,6 +149,8 @@ class Task(GObject.GObject):
 
         """List of subtasks"""
         self.subtasks = []
+        """How many of subtasks are done, kept up to date by _set_done"""
+        self.doneSubtaskCount = 0
         """Subtasks of task that are archived"""
         self.archivedSubtasks = []
         """Parent task, use parent.add_child to reparent"""
@@ -54,47 +159,68 @@ class Task(GObject.GObject):
         """How many levels of parents exist"""
         self.depth = 0
 
+        """Number of not archived subtasks in the database while
+        subtasks are not loaded, None once they are, see load_subtasks"""
+        self.unloadedSubtaskCount = None
+
         """Task UUID"""
-        self.uuid = str(uuid.uuid1())
+        self.uuid = uuid.uuid1().bytes
 
 
     def new_from_tuple(self, t):
         (uuid, title, description, color,
-         unixdate, done, parentUUID, archived) = t
+         date, done, parentUUID, archived) = t
         self.title = title
         self.description = description
-        self.color = color
-        try:
-            date = datetime.fromtimestamp(unixdate)
-            self.date = (date.year, date.month, date.day)
-        except ValueError:  # Invalid / No date
-            self.date = None
+        self.color = _colors.setdefault(color, color)
+        self.date = date
         self.done = bool(done)
         self.archived = bool(archived)
 
         self.subtasks = []
+        self.doneSubtaskCount = 0
         self.archivedSubtasks = []
 
         self.parent = None
         self.depth = 0
+        self.unloadedSubtaskCount = None
         self.uuid = uuid
 
+
+    @property
+    def bus(self):
+        """EventBus updates are published to, None outside of a tree"""
+        return self.get_root().treeBus
+
+
+    @property
+    def loader(self):
+        """Callable loading subtasks of lazily loaded tasks, or None"""
+        return self.get_root().treeLoader
+
+
+    @property
+    def subtasksLoaded(self):
+        """If subtasks were read from the database, see load_subtasks"""
+        return self.unloadedSubtaskCount is None
+
+
     def set_title(self, title):
         if title:
             self.title = title
-            self.emit("updated", TaskUpdateType.TITLE)
+            self._publish(TaskUpdateType.TITLE)
 
 
     def set_description(self, description):
         if description:
             self.description = description
-            self.emit("updated", TaskUpdateType.DESCRIPTION)
+            self._publish(TaskUpdateType.DESCRIPTION)
 
 
     def set_color(self, color):
         if color:
             self.color = color
-            self.emit("updated", TaskUpdateType.COLOR)
+            self._publish(TaskUpdateType.COLOR)
 
 
     def set_date(self, date):
@@ -102,120 +228,346 @@ class Task(GObject.GObject):
 
         if date != oldDate:
             self.date = date
-            self.emit("updated", TaskUpdateType.DATE)
+            self._publish(TaskUpdateType.DATE)
 
 
     def set_done(self, done):
-        self.done = done
+        self._set_done(done)
         self.update_done()
 
-        self.emit("updated", TaskUpdateType.DONE)
+        self._publish(TaskUpdateType.DONE)
 
 
+    @Tracing.traced("Task.update_done")
     def update_done(self):
         """Update if task is completed
 
         A task with no subtasks can be done or not depending on user
         input. A task with subtasks is done, if all of its subtasks are.
+        Parents count their done subtasks, so this only walks up the
+        chain of parents.
         """
         wasDone = self.done
 
         if self.subtasks:
-            self.done = True
-            for subtask in self.subtasks:
-                self.done = self.done and subtask.done
+            self._set_done(self.doneSubtaskCount == len(self.subtasks))
 
         if (not self.subtasks) or wasDone != self.done:
-            self.emit("updated", TaskUpdateType.DONE)
+            self._publish(TaskUpdateType.DONE)
             if self.parent:
                 self.parent.update_done()
 
 
+    def get_progress(self):
+        """Return the completed fraction of subtasks, between 0 and 1
+
+        A task with no subtasks is either completed or not.
+        """
+        if self.subtasks:
+            return self.doneSubtaskCount / len(self.subtasks)
+        return float(self.done)
+
+
+    def activate(self):
+        """Publish that task was activated in a view"""
+        self._publish(TaskUpdateType.ACTIVATED)
+
+
+    def batch(self):
+        """Return a context manager in which updates are collected and
+        published together once it exits, see EventBus.batch"""
+        if self.bus:
+            return self.bus.batch()
+        return nullcontext()
+
+
+    def _publish(self, updateType):
+        if self.bus:
+            self.bus.publish(self, updateType)
+
+
+    def _set_done(self, done):
+        """Set done, keeping done subtask count of parent up to date"""
+        if done != self.done and self.parent and not self.archived:
+            self.parent.doneSubtaskCount += 1 if done else -1
+        self.done = done
+
+
+    def load_subtasks(self, depth=1):
+        """Make sure subtasks are loaded
+
+        Lazily loaded tasks read their subtasks from the database the
+        first time they are needed. A SUBTASKS_LOADED update is
+        published for every task whose subtasks have just been loaded,
+        parents before their children.
+
+        Args:
+            depth (int): levels of subtasks to load, None for all
+
+        """
+        if not self.subtasksLoaded:
+            if self.loader:
+                loaded = self.loader(self, depth)
+                archiveIndex = self.get_root().archiveIndex
+                if archiveIndex:
+                    for subtask in self._iter_children(True):
+                        archiveIndex.add_subtree(subtask)
+                for task in loaded:
+                    task._publish(TaskUpdateType.SUBTASKS_LOADED)
+        elif depth is None or depth > 1:
+            nextDepth = None if depth is None else depth - 1
+            for subtask in self.subtasks + self.archivedSubtasks:
+                subtask.load_subtasks(nextDepth)
+
+
+    def has_subtasks(self):
+        """Return if task has (not archived) subtasks, loaded or not"""
+        if self.subtasksLoaded:
+            return bool(self.subtasks)
+        return self.unloadedSubtaskCount > 0
+
+
+    def attach_subtask(self, subtask):
+        """Add a subtask read from storage without publishing updates"""
+        if subtask.archived:
+            self.archivedSubtasks.append(subtask)
+        else:
+            self.subtasks.append(subtask)
+            if subtask.done:
+                self.doneSubtaskCount += 1
+        subtask.parent = self
+        subtask.depth = self.depth + 1
+
+
     def add_subtask(self, subtask):
+        self.load_subtasks()
         self.subtasks.append(subtask)
+        if subtask.done:
+            self.doneSubtaskCount += 1
         subtask.parent = self
         subtask.depth = self.depth + 1
-        self.emit("updated", TaskUpdateType.SUBTASK_ADDED)
-        subtask.emit("updated", TaskUpdateType.NEW)
-        self.update_done()
+        with self.batch():
+            self._publish(TaskUpdateType.SUBTASK_ADDED)
+            subtask._publish(TaskUpdateType.NEW)
+            self.update_done()
 
 
     def delete(self):
         if self.parent:
             self.parent.remove_subtask(self)
         else:
-            self.emit("updated", TaskUpdateType.DELETED)
+            self._publish(TaskUpdateType.DELETED)
 
 
 
     def remove_subtask(self, subtask):
+        with self.batch():
+            self._remove_subtask(subtask)
+
+
+    def _remove_subtask(self, subtask):
         if subtask in self.subtasks:
             self.subtasks.remove(subtask)
+            if subtask.done:
+                self.doneSubtaskCount -= 1
         elif subtask in self.archivedSubtasks:
             self.archivedSubtasks.remove(subtask)
         else:
             raise ValueError()
-        for toDelete in subtask.get_all_subtasks():
-            toDelete.emit("updated", TaskUpdateType.DELETED)
+        archiveIndex = self.get_root().archiveIndex
+        if archiveIndex:
+            archiveIndex.remove_subtree(subtask)
+        # Descendants that are not loaded are deleted from the database
+        # along with subtask, see TaskDatabaseHelper.apply_changes
+        for toDelete in subtask.iter_subtasks(includeArchived=True):
+            toDelete._publish(TaskUpdateType.DELETED)
         self.update_done()
 
 
     def archive(self):
         if self.parent:
-            self.parent.archive_subtask(self)
-            self.archived = True
-            self.emit("updated", TaskUpdateType.ARCHIVED)
+            with self.batch():
+                self.parent.archive_subtask(self)
+                self.archived = True
+                archiveIndex = self.get_root().archiveIndex
+                if archiveIndex:
+                    archiveIndex.on_archived(self)
+                self._publish(TaskUpdateType.ARCHIVED)
 
 
     def archive_subtask(self, subtask):
         self.subtasks.remove(subtask)
+        if subtask.done:
+            self.doneSubtaskCount -= 1
         self.archivedSubtasks.append(subtask)
         self.update_done()
 
 
     def dearchive(self):
         if self.parent:
-            self.parent.dearchive_subtask(self)
-            self.archived = False
-            self.emit("updated", TaskUpdateType.DEARCHIVED)
+            with self.batch():
+                self.parent.dearchive_subtask(self)
+                self.archived = False
+                archiveIndex = self.get_root().archiveIndex
+                if archiveIndex:
+                    archiveIndex.on_dearchived(self)
+                self._publish(TaskUpdateType.DEARCHIVED)
 
 
     def dearchive_subtask(self, subtask):
         self.archivedSubtasks.remove(subtask)
         self.subtasks.append(subtask)
-        self.emit("updated", TaskUpdateType.SUBTASK_DEARCHIVED)
+        if subtask.done:
+            self.doneSubtaskCount += 1
+        self._publish(TaskUpdateType.SUBTASK_DEARCHIVED)
         self.update_done()
 
 
     def get_all_subtasks(self):
         """Return a list of self and children and their children and so on"""
-        allSubtasks = [self]
-        for subtask in self.subtasks:
-            allSubtasks += subtask.get_all_subtasks()
-        return allSubtasks
+        return list(self.iter_subtasks())
+
+
+    def iter_subtasks(self, order=TraversalOrder.PRE_ORDER, predicate=None,
+                      includeArchived=False):
+        """Iterate over self and children and their children and so on
+
+        Traversal does not recurse, so it works for trees of any depth,
+        and can be stopped early by the caller.
+
+        Args:
+            order (int): a TraversalOrder value
+            predicate (callable): if present, only tasks for which it
+            returns True are yielded
+            includeArchived (bool): also visit archived subtasks
+
+        """
+        if order == TraversalOrder.PRE_ORDER:
+            tasks = self._iter_pre_order(includeArchived)
+        elif order == TraversalOrder.POST_ORDER:
+            tasks = self._iter_post_order(includeArchived)
+        elif order == TraversalOrder.BREADTH_FIRST:
+            tasks = self._iter_breadth_first(includeArchived)
+        else:
+            raise ValueError("Unknown traversal order {}".format(order))
+        if predicate is None:
+            return tasks
+        return (task for task in tasks if predicate(task))
+
+
+    def _iter_pre_order(self, includeArchived):
+        stack = [self]
+        while stack:
+            task = stack.pop()
+            yield task
+            # Pushed in reverse so that they are visited in order
+            if includeArchived:
+                stack.extend(reversed(task.archivedSubtasks))
+            stack.extend(reversed(task.subtasks))
+
+
+    def _iter_post_order(self, includeArchived):
+        stack = [(self, self._iter_children(includeArchived))]
+        while stack:
+            task, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                yield task
+            else:
+                stack.append((child, child._iter_children(includeArchived)))
+
+
+    def _iter_breadth_first(self, includeArchived):
+        queue = deque([self])
+        while queue:
+            task = queue.popleft()
+            yield task
+            queue.extend(task.subtasks)
+            if includeArchived:
+                queue.extend(task.archivedSubtasks)
+
+
+    def _iter_children(self, includeArchived):
+        yield from self.subtasks
+        if includeArchived:
+            yield from self.archivedSubtasks
 
 
     def get_all_archived_subtasks(self, onlyTop=False):
         """Gets all children in tree that are in the archive.
 
+        Root tasks answer from their ArchiveIndex, other tasks walk
+        their subtree once.
+
         Params:
             onlyTop: only get children their parents are not archived
 
         """
-        if onlyTop and self.archived:
-            return [self]
-        result = self.archivedSubtasks[:]
-        if self.archived:
-            result.append(self)
-        for child in self.subtasks:
-            result += [c for c in child.get_all_archived_subtasks(onlyTop)
-                       if c not in result]
-        if not onlyTop:
-            for child in self.archivedSubtasks:
-                result += [c for c in child.get_all_archived_subtasks(onlyTop)
-                           if c not in result]
-        return result
+        if self.archiveIndex:
+            return self.archiveIndex.get_archived(onlyTop)
+        if onlyTop:
+            return list(self._iter_top_archived())
+        return list(self.iter_subtasks(predicate=lambda t: t.archived,
+                                       includeArchived=True))
+
+
+    def get_root(self):
+        """Return the topmost parent of task"""
+        task = self
+        while task.parent:
+            task = task.parent
+        return task
+
+
+    def has_archived_parent(self):
+        parent = self.parent
+        while parent:
+            if parent.archived:
+                return True
+            parent = parent.parent
+        return False
+
+
+    def _iter_top_archived(self, includeSelf=True):
+        """Iterate over archived tasks of subtree, skipping subtasks of
+        archived tasks"""
+        if includeSelf:
+            stack = [self]
+        else:
+            stack = self.subtasks[::-1] + self.archivedSubtasks[::-1]
+        while stack:
+            task = stack.pop()
+            if task.archived:
+                yield task
+            else:
+                stack.extend(reversed(task.subtasks))
+                stack.extend(reversed(task.archivedSubtasks))
+
 
     def is_real_task(self):
         """ Return if task is real or a placeholder like rootTask"""
-        return self.uuid != "00000000-0000-0000-0000-000000000000"
+        return self.uuid != ROOT_UUID
+
+
+
+class RootTask(Task):
+
+    """Placeholder task at the top of a tree of tasks
+
+    The root keeps the state shared by all tasks of its tree, which
+    reach it through Task.get_root.
+
+    """
+
+    __slots__ = ("treeBus", "treeLoader", "archiveIndex")
+
+    def __init__(self):
+        Task.__init__(self, "Roottask")
+        self.uuid = ROOT_UUID
+        """EventBus of the tree, see Task.bus"""
+        self.treeBus = None
+        """Loader of lazily loaded tasks, see Task.loader"""
+        self.treeLoader = None
+        """ArchiveIndex of the tree"""
+        self.archiveIndex = None
@@ -1,26 +1,67 @@
-from gi.repository import GObject
-
 import Config
 import DatabaseHelper
+from EventBus import EventBus
 from Task import TaskUpdateType
 
 
 
-class TaskManager(GObject.GObject):
+class TaskManager(object):
+
+    """Loads the task tree and writes its changes to the database
 
-    def __init__(self):
+    TaskManager does not depend on GTK. Pending changes are written
+    Config.FLUSH_DELAY ms after they are made by scheduler, an object
+    with the timeout_add and source_remove methods of GLibScheduler. If
+    scheduler is None they are only written by flush.
 
-        GObject.GObject.__init__(self)
+    """
 
+    def __init__(self, scheduler=None):
+        self._scheduler = scheduler
         self._dbHelper = DatabaseHelper.TaskDatabaseHelper(Config.DB_PATH)
 
-        self.rootTask = self._dbHelper.get_root_task()
-        for task in (self.rootTask.get_all_subtasks() +
-                     self.rootTask.get_all_archived_subtasks()):
-            task.connect("updated", self.on_task_updated)
+        # Changes waiting to be written, keyed by task UUID so that
+        # repeated updates of a task are merged into a single write
+        self._dirtyTasks = {}
+        self._deletedTasks = {}
+        self._flushSource = None
+
+        if Config.COLD_STORAGE_DAYS > 0:
+            self._dbHelper.move_to_cold_storage(Config.COLD_STORAGE_DAYS)
+        self._coldStorageLoaded = False
+        # Loaded tasks that are saved in cold storage
+        self._coldUUIDs = set()
+        self._archiveLoaded = not Config.LAZY_LOADING
+
+        if Config.LAZY_LOADING:
+            self.rootTask = self._dbHelper.get_root_task(self._load_subtasks)
+        else:
+            self.rootTask = self._dbHelper.get_root_task()
+        # Updates of all tasks in the tree go through eventBus
+        self.eventBus = EventBus()
+        self.rootTask.treeBus = self.eventBus
+        # Loaded tasks by UUID
+        self._tasksByUUID = {}
+        for task in self.rootTask.iter_subtasks(includeArchived=True):
+            self._tasksByUUID[task.uuid] = task
+        self.eventBus.subscribe_changes(self.on_tasks_changed)
+
+
+    def batch(self):
+        """Return a context manager in which task updates are collected
+        and handled together once it exits, see EventBus.batch"""
+        return self.eventBus.batch()
 
 
-    def on_task_updated(self, task, updateType):
+    def on_tasks_changed(self, changes):
+        for (task, updateType) in changes:
+            self._on_task_updated(task, updateType)
+        # Changes of a batch end up in the same write
+        if self._dirtyTasks or self._deletedTasks:
+            self._schedule_flush()
+
+
+    def _on_task_updated(self, task, updateType):
         if updateType in [TaskUpdateType.TITLE,
                           TaskUpdateType.DESCRIPTION,
                           TaskUpdateType.COLOR,
@@ -30,11 +71,178 @@ class TaskManager(GObject.GObject):
                           TaskUpdateType.ARCHIVED,
                           TaskUpdateType.DEARCHIVED]:
             if task.parent:  # Root task should not be saved
-                self._dbHelper.save_task(task)
+                self._deletedTasks.pop(task.uuid, None)
+                self._dirtyTasks[task.uuid] = task
+            if updateType == TaskUpdateType.NEW:
+                self._tasksByUUID[task.uuid] = task
+                # Cold storage holds whole subtrees
+                if task.parent.uuid in self._coldUUIDs:
+                    self._coldUUIDs.add(task.uuid)
+            elif (updateType == TaskUpdateType.DEARCHIVED and
+                    task.uuid in self._coldUUIDs and
+                    task.parent.uuid not in self._coldUUIDs):
+                self._move_from_cold_storage(task)
 
-        elif updateType == TaskUpdateType.SUBTASK_ADDED:
-            for subtask in task.subtasks:
-                subtask.connect("updated", self.on_task_updated)
+        elif updateType == TaskUpdateType.SUBTASKS_LOADED:
+            for subtask in task.subtasks + task.archivedSubtasks:
+                self._tasksByUUID[subtask.uuid] = subtask
 
         elif updateType == TaskUpdateType.DELETED:
-            self._dbHelper.delete_task(task)
+            self._tasksByUUID.pop(task.uuid, None)
+            self._coldUUIDs.discard(task.uuid)
+            self._dirtyTasks.pop(task.uuid, None)
+            self._deletedTasks[task.uuid] = task
+
+
+    def load_archived_tasks(self):
+        """Load archived tasks and their parents, once
+
+        In lazy mode archived tasks are only read with the subtasks of
+        their parents, which may never be expanded. They are found with
+        an indexed query instead, like in get_dated_tasks.
+
+        """
+        if self._archiveLoaded:
+            return
+        self._archiveLoaded = True
+        self.flush()
+        for uuid in self._dbHelper.get_archived_task_uuids():
+            self._get_task(uuid)
+
+
+    def load_cold_storage(self):
+        """Load tasks in cold storage, once
+
+        Return:
+            list of loaded tasks whose parents are not in cold storage
+
+        """
+        if self._coldStorageLoaded:
+            return []
+        self._coldStorageLoaded = True
+        self.flush()
+
+        topTasks = []
+        for (parentUUID, task) in self._dbHelper.get_cold_tasks():
+            parent = self._tasksByUUID.get(parentUUID)
+            if parent is None or parentUUID not in self._coldUUIDs:
+                parent = self._get_task(parentUUID) or self.rootTask
+                # Subtasks read later would not include cold tasks and
+                # could be read again once these are moved back
+                parent.load_subtasks()
+                topTasks.append(task)
+            parent.attach_subtask(task)
+            self._tasksByUUID[task.uuid] = task
+            self._coldUUIDs.add(task.uuid)
+
+        for task in topTasks:
+            self.rootTask.archiveIndex.add_subtree(task)
+        return topTasks
+
+
+    def get_dated_tasks(self, firstDate, lastDate):
+        """Return tasks outside of the archive due between two dates,
+        sorted by date
+
+        Tasks are found with an indexed query, in lazy mode their
+        parents are loaded as needed.
+
+        Args:
+            firstDate (int): first day ordinal, None for all earlier tasks
+            lastDate (int): last day ordinal, included
+
+        """
+        self.flush()
+        tasks = []
+        for uuid in self._dbHelper.get_dated_task_uuids(firstDate, lastDate):
+            task = self._get_task(uuid)
+            if task and not task.has_archived_parent():
+                tasks.append(task)
+        return tasks
+
+
+    def get_next_date(self, date):
+        """Return the first date after date a task is due to, or None"""
+        self.flush()
+        return self._dbHelper.get_next_date(date)
+
+
+    def search(self, text, limit, offset=0):
+        """Return (uuid, title, ancestorTitles) of tasks matching text,
+        best matches first, see TaskDatabaseHelper.search
+
+        Matches are found in the database, tasks do not have to be
+        loaded. Use get_task to load a match.
+
+        """
+        self.flush()
+        return self._dbHelper.search(text, limit, offset)
+
+
+    def get_task(self, uuid):
+        """Return task with given UUID, loading it and its parents in
+        lazy mode, None if there is no such task"""
+        return self._get_task(uuid)
+
+
+    def flush(self, *args):
+        """Write all pending changes to the database in one transaction"""
+        if self._flushSource is not None:
+            self._scheduler.source_remove(self._flushSource)
+            self._flushSource = None
+        if not (self._dirtyTasks or self._deletedTasks):
+            return
+        # Deleting a task deletes its descendants, so only the tops of
+        # deleted subtrees are passed on
+        topTasks = [task for task in self._deletedTasks.values()
+                    if task.parent is None or
+                    task.parent.uuid not in self._deletedTasks]
+        self._dbHelper.apply_changes(self._dirtyTasks.values(), topTasks,
+                                     self._coldUUIDs)
+        # Changes are kept for the next flush if they were not written
+        self._dirtyTasks = {}
+        self._deletedTasks = {}
+
+
+    def _get_task(self, uuid):
+        """Return task with given UUID, loading it if needed"""
+        task = self._tasksByUUID.get(uuid)
+        if task is None and Config.LAZY_LOADING:
+            # Load subtasks of every parent, starting from the root
+            for parentUUID in reversed(
+                    self._dbHelper.get_ancestor_uuids(uuid)):
+                parent = self._tasksByUUID.get(parentUUID)
+                if parent is None:
+                    return None  # Parent is missing from database
+                parent.load_subtasks()
+            task = self._tasksByUUID.get(uuid)
+        return task
+
+
+    def _move_from_cold_storage(self, task):
+        """Move dearchived task and its subtasks back from cold storage"""
+        self.flush()
+        self._dbHelper.move_from_cold_storage(task)
+        for subtask in task.iter_subtasks(includeArchived=True):
+            self._coldUUIDs.discard(subtask.uuid)
+
+
+    def _load_subtasks(self, task, depth):
+        """Loader for lazily loaded tasks, see Task.load_subtasks"""
+        # Unsaved changes would be missing from what is read
+        self.flush()
+        return self._dbHelper.load_subtasks(task, depth)
+
+
+    def _schedule_flush(self):
+        # Changes are written at most Config.FLUSH_DELAY ms after the
+        # first of them was made
+        if self._flushSource is None and self._scheduler:
+            self._flushSource = self._scheduler.timeout_add(
+                Config.FLUSH_DELAY, self._on_flush_timeout)
+
+
+    def _on_flush_timeout(self):
+        self._flushSource = None
+        self.flush()
+        return False
@@ -1,11 +1,12 @@
-from os.path import join
+from datetime import date
 
 from gi.repository import GObject, Gtk, Gdk
 
 from TreeElement import TreeElement
 from Task import TaskUpdateType
 import Config
-import Dialogs
+import Templates
+import Tracing
 
 
 
@@ -13,20 +14,50 @@ class TaskTreeElement(TreeElement):
 
     def __init__(self, task, includeArchived=False):
         TreeElement.__init__(self)
-        self.task = task
-        self.task.connect("updated", self.on_task_updated)
+        self.task = None
 
         self._init_ui()
+        self.bind(task, includeArchived)
+
+
+    def bind(self, task, includeArchived=False):
+        """Show task in element
+
+        Elements that were unbound can be bound to a different task
+        instead of creating a new element, see ElementPool.
+
+        """
+        self.task = task
+        self.includeArchived = includeArchived
+        # Child elements are only created when the element is first
+        # expanded, so collapsed branches cost no widgets
+        self._childElementsBuilt = False
+        if self.task.bus:
+            self.task.bus.subscribe(self.on_task_updated, self.task.uuid)
+
+        self.titleLabel.set_text(self.task.title)
+        self._update_date()
+        self._update_done()
+        self._update_color()
 
-        for subtask in self.task.subtasks:
-            childElement = TaskTreeElement(subtask, includeArchived)
-            self.add_child_element(childElement)
-        if includeArchived:
-            for subtask in self.task.archivedSubtasks:
-                childElement = TaskTreeElement(subtask, includeArchived)
-                self.add_child_element(childElement)
+        if self.task.parent and self.task.parent.is_real_task():
+            self.set_has_tooltip(True)
+            self.set_tooltip_text(self.task.parent.title)
+        else:
+            self.set_has_tooltip(False)
+
+        self.show_all()
 
 
+    def unbind(self):
+        """Stop showing task and drop child elements"""
+        for childElement in self.get_child_elements():
+            childElement.unbind()
+            self.remove_child_element(childElement)
+        self.toggle_off()
+        if self.task.bus:
+            self.task.bus.unsubscribe(self.on_task_updated, self.task.uuid)
+
 
     def add_child_element(self, childElement):
         TreeElement.add_child_element(self, childElement)
@@ -34,17 +65,54 @@ class TaskTreeElement(TreeElement):
 
 
     def activate(self):
-        self.task.emit("activated")
+        self.task.activate()
+
+
+    @Tracing.traced("view", "TaskTreeElement.toggle_on")
+    def toggle_on(self):
+        # Subtasks of lazily loaded tasks are read on first expansion
+        self.task.load_subtasks(Config.PREFETCH_DEPTH)
+        if not self._childElementsBuilt:
+            self._childElementsBuilt = True
+            for subtask in self._get_shown_subtasks():
+                self._add_subtask_element(subtask)
+        TreeElement.toggle_on(self)
+
+
+    def reveal(self, task):
+        """Expand elements down to the element of task and return it
+
+        Args:
+            task (Task): a subtask of self.task, its subtask and so on
+
+        Return:
+            element of task, None if task is not shown under self
+
+        """
+        path = []
+        while task is not None and task is not self.task:
+            path.append(task)
+            task = task.parent
+        if task is None:
+            return None
+
+        element = self
+        for subtask in reversed(path):
+            element.toggle_on()
+            element = next((child for child in element.get_child_elements()
+                            if child.task is subtask), None)
+            if element is None:
+                return None
+        return element
 
 
     def activate_secondary(self):
+        import Dialogs  # Not needed until a popover is first opened
         Dialogs.TaskEditPopover(self)
 
 
+    @Tracing.traced("view", "TaskTreeElement.on_task_updated")
     def on_task_updated(self, task, updateType):
-        if task != self.task:
-            return
-
         if updateType == TaskUpdateType.TITLE:
             self.titleLabel.set_text(self.task.title)
 
@@ -61,13 +129,18 @@ class TaskTreeElement(TreeElement):
             self._on_subtask_added()
 
         elif updateType == TaskUpdateType.DELETED:
+            # Top level elements belong to the views showing them, which
+            # release them to their ElementPool
             if self._parent:
+                self.task.bus.unsubscribe(self.on_task_updated,
+                                          self.task.uuid)
                 self._parent.remove_child_element(self)
-            elif Gtk.Widget.get_parent(self):
-                Gtk.Widget.get_parent(self).remove(self)
 
         elif updateType == TaskUpdateType.ARCHIVED:
             if not self._in_archive():
+                # Drop subscriptions of the element and its children,
+                # the task gets a new element if it is dearchived
+                self.unbind()
                 if self._parent:
                     self._parent.remove_child_element(self)
                 elif Gtk.Widget.get_parent(self):
@@ -76,6 +149,9 @@ class TaskTreeElement(TreeElement):
         elif updateType == TaskUpdateType.SUBTASK_DEARCHIVED:
             self._on_subtask_dearchived()
 
+        elif updateType == TaskUpdateType.SUBTASKS_LOADED:
+            self._on_subtasks_loaded()
+
 
     def _update_color(self):
         """Update task widget color"""
@@ -97,8 +173,8 @@ class TaskTreeElement(TreeElement):
     def _update_date(self, *args):
         """Update UI when task date is changed"""
         if self.task.date:
-            date = self.task.date
-            dateStr = "{}/{}/{}".format(date[2], date[1], date[0])
+            date_ = date.fromordinal(self.task.date)
+            dateStr = "{}/{}/{}".format(date_.day, date_.month, date_.year)
             self.dateLabel.set_text(dateStr)
         if (self.dateLabel in self.labelHolder.get_children() and
                 not self.task.date):
@@ -114,7 +190,7 @@ class TaskTreeElement(TreeElement):
         If task has no children, a checkbox is shown, otherwise
         an ok emblem is shown if the task is completed.
         """
-        if self.task.subtasks:
+        if self.task.has_subtasks():
             if self.doneButton in self.ui.get_children():
                 self.ui.remove(self.doneButton)
             if self.doneImage not in self.ui.get_children():
@@ -142,22 +218,46 @@ class TaskTreeElement(TreeElement):
 
 
     def _on_subtask_added(self):
-        subtask = self.task.subtasks[-1]
-        newElement = TaskTreeElement(subtask)
-        self.add_child_element(newElement)
+        # Batches publish this once for all subtasks added in them
+        if self._childElementsBuilt:
+            self._add_missing_subtask_elements()
         self.toggle_on()
 
 
     def _on_subtask_dearchived(self):
-        subtask = self.task.subtasks[-1]
-        newElement = TaskTreeElement(subtask)
-        self.add_child_element(newElement)
+        # Elements in the archive already show archived subtasks
+        if self._childElementsBuilt:
+            self._add_missing_subtask_elements()
         self.toggle_on()
 
 
+    def _on_subtasks_loaded(self):
+        if self._childElementsBuilt:
+            for subtask in self._get_shown_subtasks():
+                self._add_subtask_element(subtask)
+
+
+    def _get_shown_subtasks(self):
+        if self.includeArchived:
+            return self.task.subtasks + self.task.archivedSubtasks
+        return self.task.subtasks
+
+
+    def _add_missing_subtask_elements(self):
+        """Add elements of shown subtasks that have none"""
+        shownTasks = {element.task for element in self.get_child_elements()}
+        for subtask in self._get_shown_subtasks():
+            if subtask not in shownTasks:
+                self._add_subtask_element(subtask)
+
+
+    def _add_subtask_element(self, subtask):
+        childElement = TaskTreeElement(subtask, self.includeArchived)
+        self.add_child_element(childElement)
+
+
     def _init_ui(self):
-        builder = Gtk.Builder()
-        builder.add_from_file(join(Config.DESIGN_DIR, "TaskWidget.glade"))
+        builder = Templates.new_builder("TaskWidget.glade")
         self.ui = builder.get_object("TaskWidget")
         self.titleLabel = builder.get_object("titleLabel")
         self.dateLabel = builder.get_object("dueLabel")
@@ -165,22 +265,13 @@ class TaskTreeElement(TreeElement):
         self.doneButton = builder.get_object("doneButton")
         self.labelHolder = builder.get_object("labelHolder")
 
-        self.titleLabel.set_text(self.task.title)
-        self._update_date()
-        self._update_done()
-
         self.set_widget(self.ui)
-        self._update_color()
-
-        if self.task.parent and self.task.parent.is_real_task():
-            self.set_has_tooltip(True)
-            self.set_tooltip_text(self.task.parent.title)
-
-        self.show_all()
 
         handlers = {"doneToggle": self._on_done_toggle}
         builder.connect_signals(handlers)
 
 
     def _on_done_toggle(self, button):
-        self.task.set_done(self.doneButton.get_active())
+        # Also called when the button is updated to show task state
+        if self.doneButton.get_active() != self.task.done:
+            self.task.set_done(self.doneButton.get_active())
@@ -0,0 +1,29 @@
+from os.path import join
+
+from gi.repository import Gtk
+
+import Config
+
+
+# Contents of design files that have been read, by file name
+_uiStrings = {}
+
+
+def new_builder(fileName):
+    """Return a new Gtk.Builder holding the objects of a design file
+
+    Design files in Config.DESIGN_DIR are read once per process and kept
+    in memory, so creating widgets from them needs no file access.
+
+    Args:
+        fileName (str): name of the file in Config.DESIGN_DIR
+
+    """
+    uiString = _uiStrings.get(fileName)
+    if uiString is None:
+        with open(join(Config.DESIGN_DIR, fileName)) as uiFile:
+            uiString = uiFile.read()
+        _uiStrings[fileName] = uiString
+    builder = Gtk.Builder()
+    builder.add_from_string(uiString)
+    return builder
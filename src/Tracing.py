@@ -0,0 +1,184 @@
+"""Opt-in timing of database statements, task updates and view refreshes
+
+Tracing is enabled by setting the TREETODO_TRACE environment variable,
+or debug/TracePath in the configuration, to the file statistics are
+written to. They are written as JSON if its name ends with .json, and
+as folded stacks for flamegraph.pl otherwise, when the program exits or
+dump is called.
+
+Timed sections nest, so every section is recorded under the path of
+sections it runs in. For each path the number of calls, total, self
+and maximum time and a histogram of times are kept. When tracing is
+disabled, traced returns functions unchanged and span does nothing.
+
+"""
+import atexit
+from contextlib import nullcontext
+import json
+from logging import info
+import os
+import sqlite3 as sql
+import time
+
+import Config
+
+PATH = os.environ.get("TREETODO_TRACE", Config.TRACE_PATH)
+enabled = bool(PATH)
+
+_NO_SPAN = nullcontext()
+
+
+
+class _Stats(object):
+
+    __slots__ = ("count", "total", "self", "max", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.self = 0.0
+        self.max = 0.0
+        # Calls by the power of two microseconds they took at most
+        self.histogram = {}
+
+
+    def add(self, elapsed, childTime):
+        self.count += 1
+        self.total += elapsed
+        self.self += elapsed - childTime
+        self.max = max(self.max, elapsed)
+        bucket = 1 << int(elapsed * 1e6).bit_length()
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+
+
+class _Span(object):
+
+    """A timed section, see span"""
+
+    __slots__ = ("name", "start", "childTime")
+
+    def __init__(self, name):
+        self.name = name
+
+
+    def __enter__(self):
+        _stack.append(self)
+        self.childTime = 0.0
+        self.start = time.perf_counter()
+
+
+    def __exit__(self, *args):
+        elapsed = time.perf_counter() - self.start
+        path = tuple(span.name for span in _stack)
+        _stack.pop()
+        if _stack:
+            _stack[-1].childTime += elapsed
+        stats = _stats.get(path)
+        if stats is None:
+            stats = _stats[path] = _Stats()
+        stats.add(elapsed, self.childTime)
+
+
+# Statistics by path of section names, and sections being timed
+_stats = {}
+_stack = []
+
+
+def span(*names):
+    """Return a context manager timing the with block under names
+
+    Names are joined with spaces, so callers can pass parts of a name
+    without formatting it while tracing is disabled.
+
+    """
+    if not enabled:
+        return _NO_SPAN
+    return _Span(" ".join(str(name) for name in names))
+
+
+def traced(*names):
+    """Decorator timing calls of a function under names, see span"""
+    def decorator(function):
+        if not enabled:
+            return function
+
+        def wrapper(*args, **kwargs):
+            with span(*names):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorator
+
+
+def connect(pathToDb):
+    """Open a database whose statements are timed if tracing is enabled"""
+    if enabled:
+        return sql.connect(pathToDb, factory=_TracedConnection)
+    return sql.connect(pathToDb)
+
+
+def dump(path=None):
+    """Write statistics to path, by default the one tracing was enabled
+    with"""
+    path = path or PATH
+    if path.endswith(".json"):
+        spans = [{"stack": list(stackPath), "count": stats.count,
+                  "total": stats.total, "self": stats.self,
+                  "max": stats.max,
+                  "histogram": {"{}us".format(bucket): count for
+                                (bucket, count)
+                                in sorted(stats.histogram.items())}}
+                 for (stackPath, stats) in sorted(_stats.items())]
+        with open(path, "w") as f:
+            json.dump({"spans": spans}, f, indent=2)
+    else:
+        # Self time in microseconds, flamegraph.pl sums up parents
+        with open(path, "w") as f:
+            for (stackPath, stats) in sorted(_stats.items()):
+                f.write("{} {}\n".format(
+                    ";".join(name.replace(";", ",") for name in stackPath),
+                    int(stats.self * 1e6)))
+    info("Trace written to {}".format(path))
+
+
+def reset():
+    """Forget statistics recorded so far"""
+    _stats.clear()
+
+
+
+def _statement_name(statement):
+    # Statements are long, their beginning tells them apart
+    return "sql " + " ".join(statement.split())[:60]
+
+
+
+class _TracedCursor(sql.Cursor):
+
+    def execute(self, statement, *args):
+        with _Span(_statement_name(statement)):
+            return sql.Cursor.execute(self, statement, *args)
+
+
+    def executemany(self, statement, *args):
+        with _Span(_statement_name(statement)):
+            return sql.Cursor.executemany(self, statement, *args)
+
+
+
+class _TracedConnection(sql.Connection):
+
+    def cursor(self, factory=_TracedCursor):
+        return sql.Connection.cursor(self, factory)
+
+
+    def commit(self):
+        with _Span("sql COMMIT"):
+            sql.Connection.commit(self)
+
+
+
+if enabled:
+    atexit.register(dump)
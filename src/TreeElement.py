@@ -1,8 +1,6 @@
-from os.path import join
-
 from gi.repository import Gtk
 
-import Config
+import Templates
 
 
 # TODO Update arrow when can not be collapsed
@@ -35,8 +33,7 @@ class TreeElement(Gtk.Box):
         self._depth = 0
 
         # Create UI
-        builder = Gtk.Builder()
-        builder.add_from_file(join(Config.DESIGN_DIR, "TreeElement.glade"))
+        builder = Templates.new_builder("TreeElement.glade")
         self._primaryArea = builder.get_object("primaryArea")
         self._childrenRevealer = builder.get_object("childrenRevealer")
         self._arrowHolder = builder.get_object("arrowHolder")
@@ -197,9 +194,12 @@ class TreeElement(Gtk.Box):
 
     def get_all_children(self):
         """Return a list of self and children and their children and so on"""
-        allChildren = [self]
-        for child in self.get_child_elements():
-            allChildren += child.get_all_children()
+        allChildren = []
+        stack = [self]
+        while stack:
+            element = stack.pop()
+            allChildren.append(element)
+            stack.extend(reversed(element.get_child_elements()))
         return allChildren
 
 
@@ -1,65 +1,80 @@
-import os
-
-from gi.repository import Gtk, Gdk
+from gi.repository import Gtk, Gdk, GLib
 
+from SearchWidget import SearchWidget
 from TaskTreeElement import TaskTreeElement
-from ArchiveWidget import ArchiveWidget
-from AgendaWidget import AgendaWidget
 from Task import TaskUpdateType
-import Dialogs
 import Config
+import Templates
+import Tracing
 
 
 class TreeTodoWindow(Gtk.Window):
 
-    def __init__(self, rootTask):
+    def __init__(self, taskManager):
         Gtk.Window.__init__(self)
         self.set_default_size(Config.DEFAULT_WIDTH, Config.DEFAULT_HEIGHT)
+        self.connect("delete-event", self._log_pool_stats)
         self.connect("delete-event", Gtk.main_quit)
 
-        self._load_tasks(rootTask)
+        self.taskManager = taskManager
+        # Agenda and archive are created when their page is first shown
+        self.agendaWidget = None
+        self.archiveWidget = None
+        self._load_tasks(taskManager.rootTask)
         self._build()
         self._create_ui()
 
 
-    def on_task_updated(self, task, updateType):
+    @Tracing.traced("view", "TreeTodoWindow.on_tasks_changed")
+    def on_tasks_changed(self, changes):
         # Do not update contents of TaskTreeElement's here
         # but only their presence in various containers
         # TODO revisit
-        if updateType == TaskUpdateType.SUBTASK_ADDED:
-            for subtask in task.subtasks:
-                subtask.connect("updated", self.on_task_updated)
-                if subtask.date:
-                    self.agendaWidget.on_update_task(subtask)
-            self._update_pane_text()
-
-        elif updateType == TaskUpdateType.DATE:
-            self.agendaWidget.on_update_task(task)
-
-        elif updateType == TaskUpdateType.DELETED:
-            self.agendaWidget.on_task_deleted(task)
-            if self.agendaWidget.get_dated_tasks(self.rootTask):
-                self.stack.set_visible_child(self.agendaWidget)
-            self._update_pane_text()
-
-        elif updateType == TaskUpdateType.ARCHIVED:
-            self.agendaWidget.on_task_deleted(task)
-            self.archiveWidget.on_task_archived(task)
-            self._update_pane_text()
-
-        elif updateType == TaskUpdateType.DEARCHIVED:
-            self.archiveWidget.on_task_dearchived(task)
-            self.agendaWidget.on_update_task(task)
-            self._update_pane_text()
+        for (task, updateType) in changes:
+            if updateType in [TaskUpdateType.SUBTASK_ADDED,
+                              TaskUpdateType.DELETED,
+                              TaskUpdateType.ARCHIVED,
+                              TaskUpdateType.DEARCHIVED]:
+                self._update_pane_text()
+                break
+
+        # Views that are not created yet read tasks once they are, and
+        # are refreshed once for all changes otherwise
+        if self.agendaWidget:
+            self._update_agenda(changes)
+        if self.archiveWidget:
+            self.archiveWidget.on_tasks_changed(changes)
+
+
+    def _update_agenda(self, changes):
+        deleted = False
+        for (task, updateType) in changes:
+            if updateType in [TaskUpdateType.SUBTASK_ADDED,
+                              TaskUpdateType.SUBTASKS_LOADED]:
+                for subtask in task.subtasks:
+                    if subtask.date:
+                        self.agendaWidget.on_update_task(subtask)
+
+            elif updateType in [TaskUpdateType.DATE,
+                                TaskUpdateType.DEARCHIVED]:
+                self.agendaWidget.on_update_task(task)
+
+            elif updateType == TaskUpdateType.DELETED:
+                self.agendaWidget.on_task_deleted(task)
+                deleted = True
+
+            elif updateType == TaskUpdateType.ARCHIVED:
+                self.agendaWidget.on_task_deleted(task)
+
+        if deleted and self.agendaWidget.has_tasks():
+            self.stack.set_visible_child(self.agendaPage)
 
 
     def _load_tasks(self, rootTask):
         self.rootTask = rootTask
         rootTask.color = Config.DEFAULT_BG
 
-        for task in (rootTask.get_all_subtasks() +
-                     rootTask.get_all_archived_subtasks()):
-            task.connect("updated", self.on_task_updated)
+        self.taskManager.eventBus.subscribe_changes(self.on_tasks_changed)
 
 
     def _create_ui(self):
@@ -70,9 +85,7 @@ class TreeTodoWindow(Gtk.Window):
 
 
     def _build(self):
-        self.builder = Gtk.Builder()
-        self.builder.add_from_file(os.path.join(Config.DESIGN_DIR,
-                                                "Window.glade"))
+        self.builder = Templates.new_builder("Window.glade")
 
         self.scroll = self.builder.get_object("scrolledWindow")
         self.noTaskLabel = self.builder.get_object("noTaskLabel")
@@ -90,8 +103,9 @@ class TreeTodoWindow(Gtk.Window):
 
         self.scroll.add_with_viewport(self.tasks)
 
-        self.agendaWidget = AgendaWidget(self.rootTask)
-        self.archiveWidget = ArchiveWidget(self.rootTask)
+        # Pages holding the agenda and archive once they are created
+        self.agendaPage = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        self.archivePage = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
 
         self.stack = Gtk.Stack()
         self.stack.set_vexpand(True)
@@ -99,8 +113,10 @@ class TreeTodoWindow(Gtk.Window):
         self.stackSwitcher = Gtk.StackSwitcher(stack=self.stack)
 
         self.stack.add_titled(self.scroll, "tasks", "Tasks")
-        self.stack.add_titled(self.agendaWidget, "agenda", "Agenda")
-        self.stack.add_titled(self.archiveWidget, "archive", "Archive")
+        self.stack.add_titled(self.agendaPage, "agenda", "Agenda")
+        self.stack.add_titled(self.archivePage, "archive", "Archive")
+        self.stack.connect("notify::visible-child",
+                           self._on_visible_page_changed)
 
         self.add(self.stack)
 
@@ -113,11 +129,65 @@ class TreeTodoWindow(Gtk.Window):
         addButton.connect("clicked", self._new_task)
         headerBar.pack_start(addButton)
         headerBar.set_custom_title(self.stackSwitcher)
+
+        self.searchWidget = SearchWidget(self.taskManager)
+        self.searchWidget.connect("task-selected", self._on_task_selected)
+        headerBar.pack_end(self.searchWidget)
         self.set_titlebar(headerBar)
 
 
     def _new_task(self, *args):
+        # Dialogs are imported when first needed to speed up startup
+        import Dialogs
         Dialogs.add_subtask(self, self.rootTask)
 
+    def _on_task_selected(self, searchWidget, uuid):
+        """Show a task found by search"""
+        task = self.taskManager.get_task(uuid)
+        if task is None:
+            return
+        if task.archived or task.has_archived_parent():
+            self.stack.set_visible_child(self.archivePage)
+            return
+        self.stack.set_visible_child(self.scroll)
+        element = self.rootElement.reveal(task)
+        if element:
+            # Wait for expanded elements to be laid out
+            GLib.idle_add(self._scroll_to_element, element)
+
+
+    def _scroll_to_element(self, element):
+        position = element.translate_coordinates(self.tasks, 0, 0)
+        if position:
+            self.scroll.get_vadjustment().set_value(position[1])
+        return False
+
+    def _on_visible_page_changed(self, stack, _):
+        page = stack.get_visible_child()
+        if page == self.agendaPage and self.agendaWidget is None:
+            from AgendaWidget import AgendaWidget
+            self.agendaWidget = AgendaWidget(self.taskManager)
+            self.agendaPage.pack_start(self.agendaWidget, True, True, 0)
+            self.agendaPage.show_all()
+
+        elif page == self.archivePage:
+            # Tasks archived long ago are only loaded when needed
+            topTasks = self.taskManager.load_cold_storage()
+            if self.archiveWidget is None:
+                self.taskManager.load_archived_tasks()
+                from ArchiveWidget import ArchiveWidget
+                self.archiveWidget = ArchiveWidget(self.rootTask)
+                self.archivePage.pack_start(self.archiveWidget, True, True, 0)
+                self.archivePage.show_all()
+            elif topTasks:
+                self.archiveWidget.on_cold_storage_loaded()
+
+
+    def _log_pool_stats(self, *args):
+        for widget in (self.agendaWidget, self.archiveWidget):
+            if widget:
+                widget.elementPool.log_stats()
+
+
     def _update_pane_text(self):
         self.noTaskLabel.set_visible(not self.rootTask.subtasks)
@@ -1,9 +1,13 @@
+import signal
 from sys import argv
 
+from gi.repository import GLib
 from gi.repository.Gtk import Application
 
+from GLibScheduler import GLibScheduler
 from TaskManager import TaskManager
 from TreeTodoWindow import TreeTodoWindow
+import Tracing
 
 
 
@@ -15,15 +19,27 @@ class TreeTodoApplication(Application):
         Application.__init__(self)
         self.connect("activate", self.on_activate)
 
-        self.taskManager = TaskManager()
+        self.taskManager = TaskManager(GLibScheduler())
 
 
     def on_activate(self, *args):
         """Start application"""
 
-        self.add_window(TreeTodoWindow(self.taskManager.rootTask))
+        window = TreeTodoWindow(self.taskManager)
+        # Pending changes must be written before the application quits
+        window.connect("delete-event", self.taskManager.flush)
+        self.add_window(window)
+
+
+def on_dump_signal():
+    Tracing.dump()
+    return True
 
 
 if __name__ == "__main__":
+    if Tracing.enabled:
+        # kill -USR1 writes the trace without quitting
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR1,
+                             on_dump_signal)
     application = TreeTodoApplication()
     application.run(argv)
@@ -0,0 +1,60 @@
+"""Maintenance jobs for the task database
+
+Run while TreeTodo is closed, for example:
+
+    python3 maintenance.py cold-storage 90
+    python3 maintenance.py orphans
+    python3 maintenance.py rebuild-search
+
+"""
+from argparse import ArgumentParser
+
+import Config
+import DatabaseHelper
+
+
+
+def move_to_cold_storage(dbHelper, args):
+    moved = dbHelper.move_to_cold_storage(args.days)
+    print("Moved {} tasks to cold storage".format(moved))
+
+
+def remove_orphans(dbHelper, args):
+    removed = dbHelper.remove_orphans()
+    print("Removed {} orphaned tasks".format(removed))
+
+
+def rebuild_search_index(dbHelper, args):
+    dbHelper.rebuild_search_index()
+    print("Rebuilt search index")
+
+
+def main():
+    parser = ArgumentParser(description="TreeTodo database maintenance")
+    parser.add_argument("--db", default=Config.DB_PATH,
+                        help="path to the task database")
+    jobs = parser.add_subparsers(dest="job")
+    jobs.required = True
+
+    coldStorage = jobs.add_parser(
+        "cold-storage",
+        help="move tasks archived more than DAYS days ago to cold storage")
+    coldStorage.add_argument("days", type=int)
+    coldStorage.set_defaults(run=move_to_cold_storage)
+
+    orphans = jobs.add_parser(
+        "orphans",
+        help="remove tasks whose parent is missing, with their subtasks")
+    orphans.set_defaults(run=remove_orphans)
+
+    rebuildSearch = jobs.add_parser(
+        "rebuild-search",
+        help="rebuild the search index, needed after VACUUM")
+    rebuildSearch.set_defaults(run=rebuild_search_index)
+
+    args = parser.parse_args()
+    args.run(DatabaseHelper.TaskDatabaseHelper(args.db), args)
+
+
+if __name__ == "__main__":
+    main()